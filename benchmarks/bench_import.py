@@ -0,0 +1,73 @@
+"""
+包导入耗时基准
+在不含config.ini的临时目录中用全新解释器导入各模块，统计导入耗时，
+并检查导入后没有提前加载paramiko、SQLAlchemy，也没有读取配置文件。
+
+用法：
+    python benchmarks/bench_import.py --repeat 10 --max-ms 1500
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+
+MODULES = ['mydatatools.MyDataTools', 'mydatatools.AlgoBaseModelScada']
+LAZY_MODULES = ['paramiko', 'sqlalchemy']
+
+CHECK_CODE = '''
+import json, sys, time
+s = time.perf_counter()
+import {module}
+cost = (time.perf_counter() - s) * 1000
+from mydatatools import read_config
+print(json.dumps({{'ms': cost, 'loaded': [m for m in {lazy!r} if m in sys.modules],
+                  'config_loaded': read_config._cf is not None}}))
+'''
+
+
+def bench_module(module, repeat, cwd, env):
+    """
+    多次在新解释器中导入模块，返回每次的耗时与最后一次的加载情况
+    """
+    costs, info = [], None
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', CHECK_CODE.format(module=module, lazy=LAZY_MODULES)],
+                             cwd=cwd, env=env, check=True, capture_output=True, text=True).stdout
+        info = json.loads(out.strip().splitlines()[-1])
+        costs.append(info['ms'])
+    return costs, info
+
+
+def main():
+    parser = argparse.ArgumentParser(description='mydatatools导入耗时基准')
+    parser.add_argument('--repeat', type=int, default=10, help='每个模块的导入次数')
+    parser.add_argument('--max-ms', type=float, default=None, help='导入耗时中位数上限(毫秒)，超出时返回非0')
+    args = parser.parse_args()
+
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=package_root + os.pathsep + os.environ.get('PYTHONPATH', ''))
+
+    failed = False
+    with tempfile.TemporaryDirectory() as cwd:
+        for module in MODULES:
+            costs, info = bench_module(module, args.repeat, cwd, env)
+            median = statistics.median(costs)
+            print(f'{module}: median {median:.1f}ms, min {min(costs):.1f}ms, max {max(costs):.1f}ms')
+            if info['loaded']:
+                print(f'  导入时提前加载了：{info["loaded"]}')
+                failed = True
+            if info['config_loaded']:
+                print('  导入时读取了config.ini')
+                failed = True
+            if args.max_ms is not None and median > args.max_ms:
+                print(f'  导入耗时超过上限{args.max_ms}ms')
+                failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,435 @@
+"""
+SCADA数据读取与模型运行基准
+在本地工作目录中生成合成的宽表SCADA数据库（SQLite，与生产环境走同一条SQLAlchemy路径）、
+点表映射汇总表.csv和config.ini，并用本地目录作为SFTP替身，测试：
+    tag_map   点表解析耗时
+    fetch     get_data读取吞吐（行/秒、MB/秒），按字段数分别测试：默认读取路径（db）、
+              驱动游标直接读取为numpy列（fast，fast_reader=True）、本地缓存命中（cache）
+    run       AlgoBaseModelScada端到端运行（读取+计算），附各阶段p50/p95
+    upload    SftpUploader上传吞吐（MB/秒），单通道与多通道
+    db_write  ResultSink结果入库吞吐（行/秒）
+结果连同当前git提交号写入JSON文件，便于不同提交之间对比。
+同一参数生成的数据库会保留在工作目录中重复使用。
+
+用法：
+    python benchmarks/bench_scada.py --rows 2500000 --columns 4,50,200
+    python benchmarks/bench_scada.py --quick
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_ROOT)
+
+FARM_CODE = '30000'
+TURBINE_TYPE = 'BENCH01'
+TABLE_NAME = 'scada'
+START_TIME = pd.Timestamp('2024-01-01')
+YEAR = str(START_TIME.year)
+URL_FORMAT = 'sqlite:///%(host)s/%(database)s.db'
+
+CONFIG_TEMPLATE = '''[run_params]
+farm_codes = ["{farm_code}"]
+turbines = [{turbines}]
+start_date = {start_date}
+end_date = {end_date}
+alarm_start_date =
+
+[conn_IB]
+host = {workdir}
+port = 0
+user = bench
+password = bench
+db =
+table_name = {table_name}
+turbine_type = {turbine_type}
+table_format =
+field_format =
+
+[conn_base]
+host = {workdir}
+port = 0
+user = bench
+password = bench
+db = base
+
+[conn_result]
+host = {workdir}
+port = 0
+user = bench
+password = bench
+db = result
+table_name = model_result
+
+[conn_sftp]
+host = 127.0.0.1
+port = 22
+user = bench
+password = bench
+
+[cache]
+enable = false
+dir = {workdir}/data_cache
+'''
+
+
+class LocalSftp(object):
+    """
+    SFTP替身：把远程路径映射到本地目录，实现上传用到的stat/mkdir/put/close
+    """
+    def __init__(self, root):
+        self.root = root
+
+    def _local(self, path):
+        return os.path.join(self.root, path.lstrip('/'))
+
+    def stat(self, path):
+        if not os.path.exists(self._local(path)):
+            raise FileNotFoundError(path)
+        return os.stat(self._local(path))
+
+    def mkdir(self, path):
+        os.mkdir(self._local(path))
+
+    def put(self, local_path, remote_path):
+        shutil.copyfile(local_path, self._local(remote_path))
+
+    def close(self):
+        pass
+
+
+def tag_names(n_columns):
+    return [f'tag_{i:03d}' for i in range(n_columns)]
+
+
+def general_names(n_columns):
+    return [f'测点{i:03d}' for i in range(n_columns)]
+
+
+def turbine_codes(n_turbines):
+    return [f'{i + 1:03d}' for i in range(n_turbines)]
+
+
+def build_workdir(workdir, rows, n_columns, n_turbines, batch=50000):
+    """
+    生成合成数据库、点表映射表和config.ini；参数相同时复用已生成的数据库
+    """
+    os.makedirs(workdir, exist_ok=True)
+    turbines = turbine_codes(n_turbines)
+    end_time = START_TIME + pd.Timedelta(seconds=rows)
+    meta = {'rows': rows, 'columns': n_columns, 'turbines': n_turbines}
+    meta_path = os.path.join(workdir, 'bench_meta.json')
+    db_path = os.path.join(workdir, f'db{FARM_CODE}_{YEAR}.db')
+
+    with open(os.path.join(workdir, 'config.ini'), 'w', encoding='utf-8') as f:
+        f.write(CONFIG_TEMPLATE.format(farm_code=FARM_CODE, turbines=json.dumps(turbines), workdir=workdir,
+                                       table_name=TABLE_NAME, turbine_type=TURBINE_TYPE, start_date=START_TIME.strftime('%Y%m%d%H%M%S'),
+                                       end_date=end_time.strftime('%Y%m%d%H%M%S')))
+
+    map_rows = [(None, None, TURBINE_TYPE, '时间', 'real_time'),
+                (None, None, TURBINE_TYPE, '风机编号', 'turbine_id')]
+    map_rows += [(None, None, TURBINE_TYPE, name, tag)
+                 for name, tag in zip(general_names(n_columns), tag_names(n_columns))]
+    pd.DataFrame(map_rows, columns=['FARM_CODE', 'TURBINE_CODE', 'TYPE', 'GENERAL_NAME_CH', 'TAG_NAME_EN']).to_csv(
+        os.path.join(workdir, '点表映射汇总表.csv'), index=False)
+
+    base = sqlite3.connect(os.path.join(workdir, 'base.db'))
+    pd.DataFrame({'CODE_': [FARM_CODE + t for t in turbines], 'MODEL_': TURBINE_TYPE}).to_sql(
+        'tb_wind_base_wtgs', base, if_exists='replace', index=False)
+    base.close()
+
+    if os.path.exists(meta_path) and os.path.exists(db_path):
+        with open(meta_path) as f:
+            if json.load(f) == meta:
+                print(f'复用已生成的数据库：{db_path}')
+                return turbines
+
+    print(f'生成数据库：{n_turbines}台机组 × {rows}行 × {n_columns}列 ...')
+    s = time.perf_counter()
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    con = sqlite3.connect(db_path)
+    con.execute('PRAGMA journal_mode = OFF')
+    con.execute('PRAGMA synchronous = OFF')
+    tags = tag_names(n_columns)
+    con.execute(f'CREATE TABLE {TABLE_NAME} (real_time TEXT, turbine_id TEXT, '
+                + ', '.join(f'{t} REAL' for t in tags) + ')')
+    insert_sql = f'INSERT INTO {TABLE_NAME} VALUES ({", ".join(["?"] * (n_columns + 2))})'
+    rng = np.random.default_rng(0)
+    for turbine in turbines:
+        turbine_id = FARM_CODE + turbine
+        for i_start in range(0, rows, batch):
+            n = min(batch, rows - i_start)
+            times = (START_TIME + pd.to_timedelta(np.arange(i_start, i_start + n), unit='s')).strftime(
+                '%Y-%m-%d %H:%M:%S')
+            values = rng.random((n, n_columns)).round(3)
+            con.executemany(insert_sql, ((t, turbine_id, *v) for t, v in zip(times, values.tolist())))
+        con.commit()
+    con.execute(f'CREATE INDEX ix_{TABLE_NAME} ON {TABLE_NAME} (turbine_id, real_time)')
+    con.commit()
+    con.close()
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+    print(f'生成耗时{time.perf_counter() - s:.1f}秒')
+    return turbines
+
+
+def db_infos(workdir):
+    ibdb_info = {'user': 'bench', 'password': 'bench', 'host': workdir, 'port': 0, 'url_format': URL_FORMAT}
+    mysqldb_info = dict(ibdb_info, database='base')
+    result_info = dict(ibdb_info, database='result', table_name='model_result')
+    return ibdb_info, mysqldb_info, result_info
+
+
+def timed(func, repeat):
+    """
+    重复执行func，返回(各次耗时列表, 最后一次的返回值)
+    """
+    costs, ret = [], None
+    for _ in range(repeat):
+        s = time.perf_counter()
+        ret = func()
+        costs.append(time.perf_counter() - s)
+    return costs, ret
+
+
+def cost_stats(costs):
+    return {'seconds_median': round(float(np.median(costs)), 6), 'seconds_min': round(float(np.min(costs)), 6),
+            'seconds_max': round(float(np.max(costs)), 6)}
+
+
+def bench_tag_map(workdir, turbines, repeat):
+    from mydatatools.MyDataTools import MyDataTools
+
+    ibdb_info, mysqldb_info, _ = db_infos(workdir)
+
+    def cold():
+        tools = MyDataTools(ibdb_info=dict(ibdb_info), mysqldb_info=dict(mysqldb_info))
+        return tools.get_tag_map(FARM_CODE, turbines[0])
+
+    tools = MyDataTools(ibdb_info=dict(ibdb_info), mysqldb_info=dict(mysqldb_info))
+    tools.get_tag_map(FARM_CODE, turbines[0])
+    n_calls = 1000
+    warm_costs, _ = timed(lambda: [tools.get_tag_map(FARM_CODE, turbines[i % len(turbines)])
+                                   for i in range(n_calls)], repeat)
+    return {'cold': cost_stats(timed(cold, repeat)[0]),
+            'warm_us_per_call': round(float(np.median(warm_costs)) / n_calls * 1e6, 3)}
+
+
+def bench_fetch(workdir, turbines, rows, columns, repeat):
+    from mydatatools.MyDataTools import MyDataTools
+
+    ibdb_info, mysqldb_info, _ = db_infos(workdir)
+    start = START_TIME.strftime('%Y-%m-%d %H:%M:%S')
+    end = (START_TIME + pd.Timedelta(seconds=rows)).strftime('%Y-%m-%d %H:%M:%S')
+    results = []
+    for n_columns in columns:
+        col_names = general_names(n_columns)
+        db_df = None
+        for mode in ('db', 'fast', 'cache'):
+            tools = MyDataTools(ibdb_info=dict(ibdb_info), mysqldb_info=dict(mysqldb_info))
+            use_cache = mode == 'cache'
+            fast_reader = mode == 'fast'
+            if use_cache:
+                tools.data_cache.clear()
+                # 首次读取写入缓存，之后的读取命中缓存
+                tools.get_data(FARM_CODE, turbines[0], col_names=col_names, start_date=start, end_date=end,
+                               use_cache=True)
+            costs, df = timed(lambda: tools.get_data(FARM_CODE, turbines[0], col_names=col_names,
+                                                     start_date=start, end_date=end, use_cache=use_cache,
+                                                     fast_reader=fast_reader), repeat)
+            median = float(np.median(costs))
+            mb = df.memory_usage(deep=True).sum() / 1024 / 1024
+            item = dict(columns=n_columns, mode=mode, rows=len(df), mb=round(mb, 2), **cost_stats(costs))
+            if mode == 'db':
+                db_df = df
+            else:
+                # 与默认读取路径的结果是否完全一致
+                item['identical'] = bool(df.equals(db_df) and df.dtypes.equals(db_df.dtypes))
+            item['rows_per_second'] = round(len(df) / median, 1)
+            item['mb_per_second'] = round(mb / median, 2)
+            print(f'  fetch {n_columns:>4}列 {mode:<5}: {item["rows_per_second"]:>12,.0f} 行/秒 '
+                  f'{item["mb_per_second"]:>8.1f} MB/秒' + ('' if item.get('identical', True) else ' 结果不一致'))
+            results.append(item)
+    return results
+
+
+def bench_run(workdir, turbines, columns, repeat):
+    from mydatatools.AlgoBaseModelScada import AlgoBaseModelScada
+    from mydatatools.MyDataTools import MyDataTools
+
+    class BenchModel(AlgoBaseModelScada):
+        @property
+        def data_tools(self):
+            if getattr(self, '_data_tools', None) is None:
+                ibdb_info, mysqldb_info, _ = db_infos(self.bench_workdir)
+                self._data_tools = MyDataTools(ibdb_info=ibdb_info, mysqldb_info=mysqldb_info)
+            return self._data_tools
+
+        def get_data_window(self, start_date=None, end_date=None, alarm_start_date=None):
+            # SQLite按字符串比较时间，运行参数中的时间转换为表中的格式
+            return (pd.Timestamp(start_date).strftime('%Y-%m-%d %H:%M:%S'),
+                    pd.Timestamp(end_date).strftime('%Y-%m-%d %H:%M:%S'))
+
+        def run_turbine(self, farm_code, turbine, pic_save_dir, data=None, **kwargs):
+            data.describe()
+            main_fig = os.path.join(pic_save_dir, 'main.csv')
+            data.iloc[:1000].to_csv(main_fig)
+            return 0, '', '', main_fig, []
+
+    # 并行模式下模型实例需要传入子进程，模型类需要可按模块路径导入
+    BenchModel.__qualname__ = BenchModel.__name__
+    BenchModel.DATA_COLUMNS = general_names(min(columns))
+    globals()['BenchModel'] = BenchModel
+
+    results = []
+    for parallel in (False, True):
+        summaries = []
+
+        def run_once():
+            model = BenchModel(dir_root=workdir, parallel=parallel)
+            model.bench_workdir = workdir
+            model.PROCESS_NUM = min(len(turbines), os.cpu_count() or 1)
+            model.run(force=True)
+            summaries.append(model.metrics.summary())
+
+        costs, _ = timed(run_once, repeat)
+        item = dict(parallel=parallel, turbines=len(turbines), columns=min(columns), **cost_stats(costs))
+        item['stages'] = summaries[-1]
+        print(f'  run parallel={parallel}: {item["seconds_median"]:.2f}秒')
+        results.append(item)
+    return results
+
+
+def bench_upload(workdir, n_files, file_kb, repeat):
+    from mydatatools.sftp_uploader import SftpUploader
+
+    local_dir = os.path.join(workdir, 'upload_files')
+    os.makedirs(local_dir, exist_ok=True)
+    files = []
+    for i in range(n_files):
+        path = os.path.join(local_dir, f'fig_{i:04d}.png')
+        with open(path, 'wb') as f:
+            f.write(os.urandom(file_kb * 1024))
+        files.append(path)
+    total_mb = n_files * file_kb / 1024
+
+    results = []
+    for channels in (1, 4):
+        remote_root = os.path.join(workdir, 'sftp_remote')
+
+        def upload_all():
+            shutil.rmtree(remote_root, ignore_errors=True)
+            os.makedirs(remote_root)
+            uploader = SftpUploader(channels=channels, sftp_factory=lambda: LocalSftp(remote_root))
+            futures = [uploader.submit([file], f'/bench/{i % 50:03d}') for i, file in enumerate(files)]
+            for future in futures:
+                future.result()
+            uploader.close()
+
+        costs, _ = timed(upload_all, repeat)
+        item = dict(channels=channels, files=n_files, mb=round(total_mb, 2), **cost_stats(costs))
+        item['mb_per_second'] = round(total_mb / float(np.median(costs)), 2)
+        print(f'  upload channels={channels}: {item["mb_per_second"]:.1f} MB/秒')
+        results.append(item)
+    return results
+
+
+def bench_db_write(workdir, n_rows, repeat):
+    from mydatatools.result_sink import ResultSink
+
+    _, _, result_info = db_infos(workdir)
+    data = [{'farm_code': FARM_CODE, 'turbine_num': f'{i % 1000:03d}', 'model_result': 0, 'model_status': 0,
+             'model_comment': '', 'model_conclusion_description': '', 'main_image': f'/bench/{i}.png',
+             'sub_image_json': {}, 'model_failure_code': 'E000'} for i in range(n_rows)]
+
+    def write_all():
+        sink = ResultSink(result_info, 'GearingBoxTempModel', 2)
+        sink.extend(data)
+        sink.flush()
+
+    costs, _ = timed(write_all, repeat)
+    item = dict(rows=n_rows, **cost_stats(costs))
+    item['rows_per_second'] = round(n_rows / float(np.median(costs)), 1)
+    print(f'  db_write: {item["rows_per_second"]:,.0f} 行/秒')
+    return item
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=PACKAGE_ROOT, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='mydatatools SCADA数据读取与模型运行基准')
+    parser.add_argument('--rows', type=int, default=2500000, help='每台机组的数据行数（1秒一行）')
+    parser.add_argument('--columns', default='4,50,200', help='读取的字段数，逗号分隔，最大值即合成表的字段数')
+    parser.add_argument('--turbines', type=int, default=2, help='机组数')
+    parser.add_argument('--repeat', type=int, default=3, help='每项测试的重复次数')
+    parser.add_argument('--upload-files', type=int, default=200, help='上传测试的文件数')
+    parser.add_argument('--upload-kb', type=int, default=200, help='上传测试的单个文件大小(KB)')
+    parser.add_argument('--result-rows', type=int, default=5000, help='入库测试的结果行数')
+    parser.add_argument('--benches', default='tag_map,fetch,run,upload,db_write', help='要运行的测试，逗号分隔')
+    parser.add_argument('--workdir', default=os.path.join(PACKAGE_ROOT, 'benchmarks', '.bench_data'),
+                        help='合成数据工作目录')
+    parser.add_argument('--output', default=None, help='结果JSON文件，默认写入benchmarks/results/')
+    parser.add_argument('--quick', action='store_true', help='小规模快速运行：5万行，4、20列')
+    args = parser.parse_args()
+    if args.quick:
+        args.rows, args.columns, args.upload_files, args.result_rows = 50000, '4,20', 50, 1000
+
+    # 逐条输出的日志会影响计时
+    logger.remove()
+    logger.add(sys.stderr, level='WARNING')
+
+    columns = sorted(int(c) for c in args.columns.split(','))
+    benches = args.benches.split(',')
+    workdir = os.path.abspath(args.workdir)
+    turbines = build_workdir(workdir, args.rows, max(columns), args.turbines)
+
+    # 配置文件与点表映射表均从当前目录读取
+    os.chdir(workdir)
+    report = {'commit': git_commit(), 'time': datetime.datetime.now().isoformat(timespec='seconds'),
+              'python': platform.python_version(), 'pandas': pd.__version__, 'platform': platform.platform(),
+              'params': {'rows': args.rows, 'columns': columns, 'turbines': args.turbines, 'repeat': args.repeat},
+              'results': {}}
+    if 'tag_map' in benches:
+        report['results']['tag_map'] = bench_tag_map(workdir, turbines, args.repeat)
+        print(f"  tag_map: warm {report['results']['tag_map']['warm_us_per_call']}微秒/次")
+    if 'fetch' in benches:
+        report['results']['fetch'] = bench_fetch(workdir, turbines, args.rows, columns, args.repeat)
+    if 'run' in benches:
+        report['results']['run'] = bench_run(workdir, turbines, columns, args.repeat)
+    if 'upload' in benches:
+        report['results']['upload'] = bench_upload(workdir, args.upload_files, args.upload_kb, args.repeat)
+    if 'db_write' in benches:
+        report['results']['db_write'] = bench_db_write(workdir, args.result_rows, args.repeat)
+
+    output = args.output
+    if output is None:
+        name = f"bench_scada_{(report['commit'] or 'nogit')[:10]}_{datetime.datetime.now():%Y%m%d%H%M%S}.json"
+        output = os.path.join(PACKAGE_ROOT, 'benchmarks', 'results', name)
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f'结果：{output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,23 @@
 import os
 import time
 import datetime
-import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine
-from sqlalchemy.types import *
 from urllib.parse import quote
 from loguru import logger
 import json
-import paramiko
-from mydatatools.read_config import *
+import hashlib
+import traceback
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from mydatatools import read_config as config
+from mydatatools.db_pool import dispose_engines
+from mydatatools.data_cache import cache_days
+from mydatatools.feature_store import FeatureStore, day_segments
+from mydatatools.fleet_catalog import shard_farms
+from mydatatools.result_sink import ResultSink
+from mydatatools.run_ledger import RunLedger, STAGE_COMPUTED, STAGE_WRITTEN
+from mydatatools.run_metrics import RunMetrics, metrics_stage
+from mydatatools.window_buffer import RollingWindowBuffer
+from mydatatools.sftp_uploader import SftpUploader, ftp_connect, ftp_mkdir, ftp_mkdir_new, ftp_makedirs
 
 # plt.rcParams['text.color'] = 'whitesmoke'   # lightgrey
 # plt.rcParams['axes.facecolor'] = 'black'
@@ -21,57 +29,33 @@ from mydatatools.read_config import *
 # plt.rcParams['axes.facecolor'] = 'midnightblue'
 
 
-def ftp_connect(host, port, username, password):
-    """
-    ftp连接
-    :param host:
-    :param port:
-    :param username:
-    :param password:
-    :return:
-    """
-    ssh_t = paramiko.Transport((host, port))
-    ssh_t.connect(username=username, password=password)
-    sftp = paramiko.SFTPClient.from_transport(ssh_t)
-    return sftp, ssh_t
+# 并行模式下子进程中的模型实例
+_WORKER_MODEL = None
 
 
-def ftp_mkdir_new(ftp, dir_path):
+def _init_worker(model):
     """
-    sftp 文件传输在remote上递归创建多级目录
-    :param ftp: sftp客户端
-    :param dir_path: 需创建的目录，绝对路径
-    :return:
+    进程池子进程初始化：保存模型实例，丢弃从父进程继承的数据库连接
     """
-    up_dir = '/'.join(dir_path.split('/')[:-1])
-    dir_name = dir_path.split('/')[-1]
-    try:
-        ftp.stat(up_dir)
-        up_dir_exist = True
-    except FileNotFoundError:
-        up_dir_exist = False
-    if up_dir_exist is True:
-        ret = up_dir + '/' + dir_name
-        ftp.mkdir(ret)
-        return ret
-    else:
-        ret = ftp_mkdir_new(ftp, up_dir) + '/' + dir_name
-        ftp.mkdir(ret)
-        return ret
-
-
-def ftp_mkdir(ftp, dir_path):
+    global _WORKER_MODEL
+    _WORKER_MODEL = model
+    dispose_engines(close=False)
+
+
+def _run_turbine_worker(farm_code, turbine, start_date, end_date, alarm_start_date):
     """
-    sftp 创建remote目录，目录存在则直接返回，不存在则新建目录
-    :param ftp:
-    :param dir_path:
-    :return:
+    子进程中执行单台机组的计算，异常不向外抛出，
+    返回(结果, 错误信息, 各阶段计时记录, 本台机组写入feature_result的条目)
     """
+    _WORKER_MODEL.metrics = RunMetrics(_WORKER_MODEL.MODEL_NAME)
+    before = dict(_WORKER_MODEL.feature_result)
     try:
-        ftp.stat(dir_path)
-        return dir_path
-    except FileNotFoundError:
-        return ftp_mkdir_new(ftp, dir_path)
+        ret = _WORKER_MODEL._run_one_turbine(farm_code, turbine, start_date=start_date, end_date=end_date,
+                                             alarm_start_date=alarm_start_date)
+        error = None
+    except Exception:
+        ret, error = None, traceback.format_exc()
+    return ret, error, _WORKER_MODEL.metrics.records, _WORKER_MODEL._feature_result_delta(before)
 
 
 class AlgoBaseModelScada(object):
@@ -81,9 +65,21 @@ class AlgoBaseModelScada(object):
     MODEL_VERSION = 1.0
     MODEL_FROM = 2   # 边缘度模型：1；云端故障诊断模型：2；云端健康值模型：3
     PROCESS_NUM = 10
+    # 并行模式下不传入子进程的属性
+    UNPICKLABLE_ATTRS = ('sftp', 'ssh', 'uploader', 'result_sink', '_data_tools', 'metrics', '_feature_store')
+    # 结果图片后台上传的SFTP通道数
+    UPLOAD_CHANNELS = 4
+    # 结果每批入库条数；每个风场结束时也会入库一次
+    RESULT_BATCH_SIZE = 200
+    # 是否覆盖同一运行日期的旧结果，重复运行不产生重复数据
+    RESULT_UPSERT = False
+    # 模型需要的通用字段名称，声明后由基类读取机组数据并通过data参数传入run_turbine
+    DATA_COLUMNS = None
+    # 串行模式下后台预读数据的机组数，内存中最多同时保留PREFETCH_NUM + 1台机组的数据
+    PREFETCH_NUM = 2
 
     def __init__(self, data_date_range='D', alarm_date_range=None, is_to_db=False, db_info=None, dir_root='./', ftp_info=None, read_old=True,
-                 update_old_file=False, **kwargs):        # /data/cms_card_collection_data
+                 update_old_file=False, parallel=False, shard_index=0, shard_count=1, **kwargs):        # /data/cms_card_collection_data
         self.MODEL_NAME = self.__class__.__name__
         logger.info('=' * 10 + str(self.MODEL_NAME) + str(self.MODEL_VERSION) + '=' * 10)
         # self.INFO_TYPE_DIR = os.path.join(dir_root, 'gearing_info_files')
@@ -98,35 +94,49 @@ class AlgoBaseModelScada(object):
         if db_info is None:
             logger.info('结果写入默认数据库地址')
             self.db_info = {
-                'user': RESULT_USER,
-                'password': quote(RESULT_PASSWORD),
-                'host': RESULT_HOST,
-                'port': RESULT_PORT,
-                'database': RESULT_DB,
-                'table_name': RESULT_TABLE
+                'user': config.RESULT_USER,
+                'password': quote(config.RESULT_PASSWORD),
+                'host': config.RESULT_HOST,
+                'port': config.RESULT_PORT,
+                'database': config.RESULT_DB,
+                'table_name': config.RESULT_TABLE
             }
         else:
             self.db_info = db_info
         # self.csv_root = os.path.join(dir_root, 'upload_finish')
         self.pkl_root = os.path.join(dir_root, 'pkl')
+        # 运行记录，任务中途失败后重新运行时跳过已完成的机组
+        self.ledger_path = os.path.join(dir_root, 'run_ledger.db')
+        # 分阶段计时，运行结束时输出运行报告
+        self.metrics = RunMetrics(self.MODEL_NAME)
+        self.report_dir = os.path.join(dir_root, 'run_report')
+        # 日特征持久化存储，滚动窗口模型只计算新增日期的特征
+        self.feature_store_path = os.path.join(dir_root, 'feature_store', f'{self.MODEL_NAME}.db')
         self.project_id = "scada_temp"
         self.read_old = read_old
         self.update_old_file = update_old_file
+        # 并行模式：按PROCESS_NUM启动进程池并行执行run_turbine，单台机组失败不影响其他机组
+        self.parallel = parallel
+        # 分片运行：风场按机组数均衡分为shard_count片，本实例只运行第shard_index片
+        self.shard_index = shard_index
+        self.shard_count = shard_count
         self.kwargs = kwargs
         # TODO 结果上传的目录需要修改
         if ftp_info is None:
             # logger.info('结果写入默认数据库地址')
             self.ftp_info = {
-                'host': SFTP_HOST,
-                'port': SFTP_PORT,
-                'username': SFTP_USER,
-                'password': SFTP_PASSWORD
+                'host': config.SFTP_HOST,
+                'port': config.SFTP_PORT,
+                'username': config.SFTP_USER,
+                'password': config.SFTP_PASSWORD
             }
         else:
             self.ftp_info = ftp_info
         self.upload_root_dir = f'/data/cms_card_collection_data/model_result/{self.MODEL_NAME}/image'
         if self.is_to_db:
             self.sftp, self.ssh = ftp_connect(**self.ftp_info)
+            # self.sftp连接上已知存在的远程目录，upload_files创建目录时命中则不再stat
+            self.known_dirs = set()
 
     def get_args(self, data_date_range='D', alarm_date_range=None):
         """
@@ -138,10 +148,10 @@ class AlgoBaseModelScada(object):
         end_date:  新数据结束时间
         alarm_start_date： 用于预警判断的数据起始日期。
         """
-        farm_code_ = json.loads(RUN_FARM_CODES)
-        turbines_ = json.loads(RUN_TURBINES)
+        farm_code_ = json.loads(config.RUN_FARM_CODES) or []
+        turbines_ = json.loads(config.RUN_TURBINES)
         if turbines_ is None:
-            turbines_ = [[] * len(farm_code_)]
+            turbines_ = [[] for _ in farm_code_]
 
         today = datetime.date.today()
         yesterday = today - datetime.timedelta(days=1)
@@ -173,15 +183,36 @@ class AlgoBaseModelScada(object):
         else:
             alarm_start_date_default = None
 
-        start_date_ = RUN_START_DATE or start_date_default
-        end_date_ = RUN_END_DATE or end_date_default
-        alarm_start_date_ = RUN_ALARM_START_DATE or alarm_start_date_default
+        start_date_ = config.RUN_START_DATE or start_date_default
+        end_date_ = config.RUN_END_DATE or end_date_default
+        alarm_start_date_ = config.RUN_ALARM_START_DATE or alarm_start_date_default
         return farm_code_, turbines_, start_date_, end_date_, alarm_start_date_
 
+    def plan_turbines(self, farm_codes, turbines_lis):
+        """
+        补全本次运行的风场、机组：风场列表为空时运行机组目录中的所有风场，某风场机组列表为空时运行该风场下所有的机组；
+        再按shard_index/shard_count分片
+        :return: (farm_codes, turbines_lis)
+        """
+        turbines_lis = [list(turbines) for turbines in turbines_lis]
+        if len(farm_codes) == 0 or len(turbines_lis) < len(farm_codes) or \
+                any(len(turbines) == 0 for turbines in turbines_lis):
+            catalog = self.data_tools.get_fleet_catalog()
+            if len(farm_codes) == 0:
+                farm_codes, turbines_lis = catalog.get_farm_codes(), []
+            turbines_lis += [[] for _ in range(len(farm_codes) - len(turbines_lis))]
+            turbines_lis = [turbines or catalog.get_turbines(farm_code)
+                            for farm_code, turbines in zip(farm_codes, turbines_lis)]
+            for farm_code, turbines in zip(farm_codes, turbines_lis):
+                if len(turbines) == 0:
+                    logger.warning(f'[{self.MODEL_NAME}] 风场{farm_code}未查询到机组')
+        return shard_farms(farm_codes, turbines_lis, self.shard_index, self.shard_count)
+
     def run_turbine(self, farm_code, turbine, pic_save_dir, start_date=None, end_date=None,
                     pkl_fig=None, alarm_start_date=None):
         """
         机组具体算法函数，需要重写
+        声明了DATA_COLUMNS时，还会传入data参数：get_turbine_data读取的机组数据
         必须返回：status, comment, description, main_fig, sub_figs
         """
         raise NotImplementedError('run_service 方法未实现')
@@ -196,52 +227,274 @@ class AlgoBaseModelScada(object):
         :param data:
         :return:
         """
-        model_id_dict = {'mainbearing_fd': 2, 'gearing_low_state_fd': 3, 'generator_electric_fd': 4,
-                         'cms_mainbearing_worsen_factor': 7, 'cms_gearingbox_worsen_factor': 9,
-                         'cms_generator_worsen_factor': 10, 'GearingBoxTempModel': 18, 'GeneratorWindingTempModel': 20,
-                         'GearingBoxOilFilterFDModel': 21}
-        engine = create_engine(
-            'mysql+pymysql://%(user)s:%(password)s@%(host)s:%(port)d/%(database)s?charset=utf8'
-            % self.db_info
-        )
         if not isinstance(data, list):
             data = [data]
-        ret_df = pd.DataFrame(data)
-
-        if self.MODEL_NAME not in model_id_dict:
-            ret_db_df = pd.read_sql(f"select id from cms_model_info where model_name_en='{self.MODEL_NAME}' limit 1",
-                                    con=engine)
-            model_id = ret_db_df["id"][0]
-        else:
-            model_id = model_id_dict[self.MODEL_NAME]
-
-        ret_df["model_from"] = self.MODEL_FROM
-        ret_df["model_id"] = model_id
-        ret_df["model_name"] = self.MODEL_NAME
-        ret_df["model_run_time"] = datetime.datetime.now()
-        ret_df["img_sync_status"] = 0
-        ret_df["project_id"] = 'scada'
-
-        if len(ret_df) > 0:
-            logger.debug(f'[{self.__class__.__name__}] 结果数据长度：{len(ret_df)}')
-            logger.debug(f'[{self.__class__.__name__}] 结果数据：{ret_df.head(3)}')
-            ret_df.to_sql(name=self.db_info['table_name'], con=engine, if_exists='append', index=False,
-                          dtype={"sub_image_json": JSON})
-        else:
+        # run()中使用本次运行共享的sink，单独调用时新建
+        sink = getattr(self, 'result_sink', None) or self._result_sink()
+        written = sink.written
+        with metrics_stage(self.metrics, 'db_write') as rec:
+            rec['rows'] = len(data)
+            sink.extend(data)
+            sink.flush()
+        # extend中已按批写入，最后一次flush的返回值不代表本次写入的条数
+        if sink.written == written:
             logger.info(f'[{self.__class__.__name__}] 结果数据长度为0，无需入库')
-            print(ret_df)
+
+    def _result_sink(self, run_time=None):
+        return ResultSink(self.db_info, self.MODEL_NAME, self.MODEL_FROM, batch_size=self.RESULT_BATCH_SIZE,
+                          upsert=self.RESULT_UPSERT, run_time=run_time)
 
     def upload_files(self, files, remote_dir):
-        remote_dir = ftp_mkdir(self.sftp, remote_dir)
-        logger.info(f'文件上传目录：{remote_dir}')
-        remote_files = [remote_dir + '/' + f.split(os.path.sep)[-1] for f in files]
-        for file, r_file in zip(files, remote_files):
-            self.sftp.put(file, r_file)
-            logger.info(f'{file}文件上传{r_file}成功！')
+        with metrics_stage(self.metrics, 'upload', remote_dir=remote_dir) as rec:
+            rec['files'] = len(files)
+            rec['bytes'] = sum(os.path.getsize(file) for file in files)
+            # run()中后台上传器与self.sftp使用同一SSH连接，共享其已知目录
+            uploader = getattr(self, 'uploader', None)
+            known_dirs = uploader.known_dirs if uploader is not None else self.known_dirs
+            remote_dir = ftp_mkdir(self.sftp, remote_dir, known_dirs)
+            logger.info(f'文件上传目录：{remote_dir}')
+            remote_files = [remote_dir + '/' + f.split(os.path.sep)[-1] for f in files]
+            for file, r_file in zip(files, remote_files):
+                self.sftp.put(file, r_file)
+                logger.info(f'{file}文件上传{r_file}成功！')
         return remote_files
 
-    def run(self):
+    @property
+    def data_tools(self):
+        if getattr(self, '_data_tools', None) is None:
+            from mydatatools.MyDataTools import MyDataTools
+            self._data_tools = MyDataTools(metrics=self.metrics)
+        # 并行模式下子进程每台机组替换self.metrics，取数计时记录到当前的metrics中
+        self._data_tools.metrics = self.metrics
+        return self._data_tools
+
+    def get_data_window(self, start_date=None, end_date=None, alarm_start_date=None):
+        """
+        模型需要的数据时间范围，默认为本次运行的开始结束时间，可重写
+        return：(开始时间, 结束时间)
+        """
+        return start_date, end_date
+
+    def get_turbine_data(self, farm_code, turbine, start_date=None, end_date=None, alarm_start_date=None):
+        """
+        读取机组数据，默认读取DATA_COLUMNS在get_data_window范围内的数据，可重写
+        """
+        data_start, data_end = self.get_data_window(start_date=start_date, end_date=end_date,
+                                                    alarm_start_date=alarm_start_date)
+        return self.data_tools.get_data(farm_code, turbine, col_names=self.DATA_COLUMNS,
+                                        start_date=data_start, end_date=data_end)
+
+    @property
+    def feature_store(self):
+        if getattr(self, '_feature_store', None) is None:
+            self._feature_store = FeatureStore(self.feature_store_path, version=self.MODEL_VERSION)
+        return self._feature_store
+
+    def compute_daily_features(self, farm_code, turbine, start_date, end_date):
+        """
+        计算[start_date, end_date)内每天的特征，返回以日期为索引、特征名为列的DataFrame，使用get_daily_features时需要重写
+        """
+        raise NotImplementedError('compute_daily_features 方法未实现')
+
+    def get_daily_features(self, farm_code, turbine, start_date, end_date, features=None, compute_func=None):
+        """
+        获取[start_date, end_date)内完整日期的日特征：已保存的日期直接读取，
+        只对缺失的连续日期段调用compute_func(farm_code, turbine, 段开始, 段结束)计算并保存。
+        结束不足CACHE_SETTLE_HOURS小时的日期可能还有延迟入库的数据，每次重新计算、不保存。
+        结果同时保存在self.feature_result['{farm_code}_{turbine}']中
+        :param features: 需要的特征名列表，为None时读取全部特征
+        :param compute_func: 日特征计算函数，默认为compute_daily_features
+        :return: 以日期为索引、特征名为列的DataFrame
+        """
+        compute_func = compute_func or self.compute_daily_features
+        days, _, _ = cache_days(start_date, end_date)
+        settled_days, _, _ = cache_days(start_date, end_date, settle_hours=config.CACHE_SETTLE_HOURS)
+        missing = self.feature_store.missing_days(farm_code, turbine, days, features)
+        unsettled = []
+        for segment_start, segment_end in day_segments(missing):
+            df = compute_func(farm_code, turbine, segment_start, segment_end)
+            if df is not None and len(df) > 0:
+                df.index = pd.to_datetime(df.index).normalize()
+                df = df[(df.index >= segment_start) & (df.index < segment_end)]
+                is_settled = df.index.isin(settled_days)
+                self.feature_store.write(farm_code, turbine, df[is_settled])
+                unsettled.append(df[~is_settled])
+        features_df = self.feature_store.read(farm_code, turbine, days, features)
+        unsettled = [df for df in unsettled if len(df) > 0]
+        if unsettled:
+            features_df = pd.concat([features_df] + unsettled).sort_index()
+            if features is not None:
+                features_df = features_df.reindex(columns=[f for f in features if f in features_df.columns])
+        self.feature_result[f'{farm_code}_{turbine}'] = features_df
+        return features_df
+
+    def get_window_data(self, farm_code, turbine, col_names, start_date, end_date, refetch='1h'):
+        """
+        获取预警窗口等滚动时间窗口[start_date, end_date)的数据。
+        窗口数据按 模型/机组/字段集合 缓存在pkl_root下，窗口每天向后滚动时只查询新增的时间段，
+        并重新查询缓冲末尾refetch时长的数据以补齐入库延迟的数据，早于窗口起点的数据被丢弃。
+        :param col_names: 通用字段名称列表
+        :param refetch: 重新查询缓冲末尾的时长，None时不重新查询
+        :return: 以时间为索引的DataFrame，与get_data一致
+        """
+        if not isinstance(col_names, list):
+            col_names = [col_names]
+        cols_key = hashlib.md5(json.dumps(sorted(col_names), ensure_ascii=False).encode('utf-8')).hexdigest()[:12]
+        path = os.path.join(self.pkl_root, farm_code, turbine, self.project_id,
+                            f'window_{self.MODEL_NAME}_{cols_key}.pkl')
+
+        def fetch(start, end):
+            with metrics_stage(self.metrics, 'fetch_window', farm_code=farm_code, turbine=turbine) as rec:
+                data = self.data_tools.get_data(farm_code, turbine, col_names=col_names,
+                                                start_date=start.strftime('%Y-%m-%d %H:%M:%S'),
+                                                end_date=end.strftime('%Y-%m-%d %H:%M:%S'))
+                rec['rows'] = len(data)
+            return data
+
+        return RollingWindowBuffer(path).get(fetch, start_date, end_date, refetch=refetch)
+
+    def _prefetch_turbines(self, executor, farm_code, turbines, start_date=None, end_date=None,
+                           alarm_start_date=None):
+        """
+        在后台线程中提前读取后续PREFETCH_NUM台机组的数据，依次返回(机组, 数据Future)
+        """
+        window = []
+        turbines = iter(turbines)
+        while True:
+            while len(window) <= self.PREFETCH_NUM:
+                turbine = next(turbines, None)
+                if turbine is None:
+                    break
+                window.append((turbine, executor.submit(self._fetch_turbine_data, farm_code, turbine,
+                                                        start_date=start_date, end_date=end_date,
+                                                        alarm_start_date=alarm_start_date)))
+            if len(window) == 0:
+                return
+            yield window.pop(0)
+
+    def _fetch_turbine_data(self, farm_code, turbine, start_date=None, end_date=None, alarm_start_date=None):
+        with metrics_stage(self.metrics, 'fetch', farm_code=farm_code, turbine=turbine) as rec:
+            data = self.get_turbine_data(farm_code, turbine, start_date=start_date, end_date=end_date,
+                                         alarm_start_date=alarm_start_date)
+            rec['rows'] = len(data) if data is not None else 0
+        return data
+
+    def _run_one_turbine(self, farm_code, turbine, start_date=None, end_date=None, alarm_start_date=None,
+                         data=None):
+        """
+        创建机组的本地目录并执行run_turbine
+        声明了DATA_COLUMNS时传入机组数据，data为None时在当前进程读取
+        """
+        kwargs = {}
+        if self.DATA_COLUMNS is not None:
+            if data is None:
+                data = self._fetch_turbine_data(farm_code, turbine, start_date=start_date, end_date=end_date,
+                                                alarm_start_date=alarm_start_date)
+            kwargs['data'] = data
+
+        one_turbine_fig = os.path.join(self.IMAGE_FILES_PATH, farm_code, turbine)
+        os.makedirs(one_turbine_fig, exist_ok=True)
+        pkl_fig = os.path.join(self.pkl_root, farm_code, turbine, self.project_id)
+        os.makedirs(pkl_fig, exist_ok=True)
+
+        with metrics_stage(self.metrics, 'compute', farm_code=farm_code, turbine=turbine):
+            return self.run_turbine(farm_code, turbine, one_turbine_fig,
+                                    start_date=start_date,
+                                    end_date=end_date,
+                                    pkl_fig=pkl_fig,
+                                    alarm_start_date=alarm_start_date,
+                                    **kwargs)
+
+    def _feature_result_delta(self, before):
+        """
+        与before相比新增或替换的feature_result条目，即一台机组计算期间写入的条目
+        """
+        return {k: v for k, v in self.feature_result.items() if k not in before or before[k] is not v}
+
+    def _run_local_turbine(self, farm_code, turbine, **kwargs):
+        """
+        在当前进程中执行单台机组的计算，返回(结果, 错误信息, 写入feature_result的条目)，异常直接抛出
+        """
+        before = dict(self.feature_result)
+        ret = self._run_one_turbine(farm_code, turbine, **kwargs)
+        return ret, None, self._feature_result_delta(before)
+
+    def _wait_turbine(self, farm_code, turbine, future):
+        """
+        等待并行模式下机组的计算结果，返回(结果, 错误信息, 写入feature_result的条目)，单台机组失败只记录日志；
+        子进程中run_turbine写入feature_result的条目合并到当前实例，供run_farm使用
+        """
+        try:
+            ret, error, records, features = future.result()
+            # 子进程中已输出过这些记录，只合并不重复输出
+            self.metrics.extend(records, log=False)
+            self.feature_result.update(features)
+        except Exception as e:
+            ret, error, features = None, repr(e), {}
+        if error is not None:
+            logger.error(f'[{self.MODEL_NAME}] 机组{farm_code}_{turbine}计算失败：{error}')
+        return ret, error, features
+
+    def _submit_result(self, farm_code, turbine_num, ret, upload_dir, remote_files=None):
+        """
+        提交结果图片的后台上传，返回(入库的结果数据, 上传Future)，远程路径在上传完成后回填
+        remote_files：图片已上传时的远程路径列表，不再重复上传
+        """
+        status, comment, description, main_fig, sub_figs = ret
+
+        figs = [main_fig] + sub_figs
+        result_dict = {'farm_code': farm_code, 'turbine_num': turbine_num, 'model_result': status,
+                       'model_status': status, 'model_comment': comment,
+                       'model_conclusion_description': description,
+                       'main_image': None, 'sub_image_json': None, 'model_failure_code': 'E000'}
+        if remote_files is not None:
+            future = Future()
+            future.set_result(remote_files)
+            return result_dict, future
+        return result_dict, self.uploader.submit(figs, upload_dir)
+
+    def _resume_result(self, farm_code, turbine_num, record, upload_dir, pending):
+        """
+        按运行记录恢复已计算的机组：恢复写入feature_result的条目，已入库的跳过，已计算未入库的从未完成的阶段继续
+        """
+        stage, ret, remote_files, state = record
+        self.feature_result.update(state)
+        if ret is None or not self.is_to_db or stage == STAGE_WRITTEN:
+            return
+        if stage == STAGE_COMPUTED:
+            remote_files = None
+        pending.append(self._submit_result(farm_code, turbine_num, ret, upload_dir, remote_files=remote_files))
+
+    def _collect_results(self, pending):
+        """
+        等待后台上传完成，回填远程图片路径；上传失败的结果只记录日志，不入库
+        """
+        result_dicts = []
+        for result_dict, future in pending:
+            try:
+                remote_files = future.result()
+            except Exception as e:
+                logger.error(f"[{self.MODEL_NAME}] {result_dict['farm_code']}_{result_dict['turbine_num']}"
+                             f"结果图片上传失败：{e!r}")
+                continue
+            result_dict['main_image'] = remote_files[0]
+            result_dict['sub_image_json'] = {f'子图{i_name}': pic_i for i_name, pic_i in enumerate(remote_files[1:])}
+            result_dicts.append(result_dict)
+        return result_dicts
+
+    def __getstate__(self):
+        # 并行模式下模型实例需要传入子进程，sftp连接等无法序列化的属性不传
+        state = self.__dict__.copy()
+        for name in self.UNPICKLABLE_ATTRS:
+            state.pop(name, None)
+        return state
+
+    def run(self, force=False):
+        """
+        :param force: 为True时忽略本次运行日期、数据时间范围的运行记录，全部重新计算
+        """
         farm_codes, turbines_lis, start_date, end_date, alarm_start_date = self.get_args(data_date_range=self.data_date_range)
+        farm_codes, turbines_lis = self.plan_turbines(farm_codes, turbines_lis)
 
         print(farm_codes)
         print(turbines_lis)
@@ -253,79 +506,134 @@ class AlgoBaseModelScada(object):
         print(now)
         all_start_s = time.time()
 
-        result_dicts = []
         self.IMAGE_FILES_PATH = os.path.join(self.IMAGE_FILES_PATH, model_run_date)
         self.upload_root_dir = self.upload_root_dir + f'/{model_run_date}'
+        ledger = RunLedger(self.ledger_path, self.MODEL_NAME, model_run_date, start_date, end_date)
+        if force:
+            ledger.clear()
+        done = ledger.load()
+        if len(done) > 0:
+            logger.info(f'[{self.MODEL_NAME}] 按运行记录跳过{len(done)}个已完成的机组/风场计算')
+        todo_lis = [[turbine for turbine in turbines if (farm_code, turbine) not in done]
+                    for farm_code, turbines in zip(farm_codes, turbines_lis)]
+        if self.is_to_db:
+            # 结果图片在后台多通道上传，与后续机组的计算重叠
+            self.uploader = SftpUploader(transport=self.ssh, ftp_info=self.ftp_info, channels=self.UPLOAD_CHANNELS,
+                                         metrics=self.metrics)
+            # 结果按批、按风场增量入库，中途失败时已完成风场的结果不会丢失
+            self.result_sink = self._result_sink()
 
-        for farm_code, turbines in zip(farm_codes, turbines_lis):
-            print(farm_code)
-            print(turbines)
-            if len(turbines) == 0:
-                # 查询该风场下所有的机组
-                pass
-
-            for turbine in turbines:
-                print(turbine)
-
-                local_file_path = os.path.join(farm_code, turbine)
-                one_turbine_fig = os.path.join(self.IMAGE_FILES_PATH, local_file_path)
-                os.makedirs(one_turbine_fig, exist_ok=True)
-                pkl_fig = os.path.join(self.pkl_root, farm_code, turbine, self.project_id)
-                os.makedirs(pkl_fig, exist_ok=True)
-
-                ret = self.run_turbine(farm_code, turbine, one_turbine_fig,
-                                       start_date=start_date,
-                                       end_date=end_date,
-                                       pkl_fig=pkl_fig,
-                                       alarm_start_date=alarm_start_date)
-                if ret is not None and self.is_to_db:
-                    status, comment, description, main_fig, sub_figs = ret
-
-                    figs = [main_fig] + sub_figs
-                    upload_turbine_dir = self.upload_root_dir + f'/{farm_code}/{turbine}'
-                    remote_files = self.upload_files(figs, upload_turbine_dir)
-
-                    sub_figs = {f'子图{i_name}': pic_i for i_name, pic_i in enumerate(remote_files[1:])}
-                    result_dict = {'farm_code': farm_code, 'turbine_num': turbine, 'model_result': status,
-                                   'model_status': status, 'model_comment': comment,
-                                   'model_conclusion_description': description,
-                                   'main_image': remote_files[0], 'sub_image_json': sub_figs, 'model_failure_code': 'E000'}
-
-                    result_dicts.append(result_dict)
-                # break
-
-            local_file_path = os.path.join(farm_code, farm_code+'_all')
-            one_farm_fig = os.path.join(self.IMAGE_FILES_PATH, local_file_path)
-            os.makedirs(one_farm_fig, exist_ok=True)
-
-            ret = self.run_farm(farm_code, one_farm_fig, start_date=start_date,
-                                end_date=end_date, alarm_start_date=alarm_start_date)
-            if ret is not None and self.is_to_db:
-                status, comment, description, main_fig, sub_figs = ret
-
-                figs = [main_fig] + sub_figs
-                upload_turbine_dir = self.upload_root_dir + f'/{farm_code}/{farm_code}_all'
-                remote_files = self.upload_files(figs, upload_turbine_dir)
-
-                sub_figs = {f'子图{i_name}': pic_i for i_name, pic_i in enumerate(remote_files[1:])}
-                result_dict = {'farm_code': farm_code, 'turbine_num': 'farm', 'model_result': status,
-                               'model_status': status, 'model_comment': comment,
-                               'model_conclusion_description': description,
-                               'main_image': remote_files[0], 'sub_image_json': sub_figs, 'model_failure_code': 'E000'}
+        if self.is_to_db:
+            # 预先一次性创建本次运行所有风场、机组的远程上传目录
+            upload_dirs = []
+            for farm_code, turbines in zip(farm_codes, turbines_lis):
+                upload_dirs += [self.upload_root_dir + f'/{farm_code}/{turbine}' for turbine in turbines]
+                upload_dirs.append(self.upload_root_dir + f'/{farm_code}/{farm_code}_all')
+            self.uploader.makedirs(upload_dirs)
+
+        # 并行模式：所有机组一次性提交进程池，按风场、机组顺序收集结果
+        executor, farm_futures, prefetcher = None, [], None
+        if self.parallel and self.PROCESS_NUM > 1:
+            executor = ProcessPoolExecutor(max_workers=self.PROCESS_NUM, initializer=_init_worker, initargs=(self,))
+            for farm_code, turbines in zip(farm_codes, todo_lis):
+                farm_futures.append([(turbine, executor.submit(_run_turbine_worker, farm_code, turbine, start_date,
+                                                               end_date, alarm_start_date))
+                                     for turbine in turbines])
+        elif self.DATA_COLUMNS is not None:
+            # 串行模式：读取下一台机组数据与当前机组的计算重叠
+            prefetcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix='prefetch')
+
+        try:
+            for i_farm, (farm_code, turbines) in enumerate(zip(farm_codes, turbines_lis)):
+                print(farm_code)
+                print(turbines)
+                pending = []
+
+                for turbine in turbines:
+                    if (farm_code, turbine) in done:
+                        upload_turbine_dir = self.upload_root_dir + f'/{farm_code}/{turbine}'
+                        self._resume_result(farm_code, turbine, done[(farm_code, turbine)], upload_turbine_dir,
+                                            pending)
+
+                if prefetcher is not None:
+                    turbine_rets = ((turbine, *self._run_local_turbine(farm_code, turbine, start_date=start_date,
+                                                                       end_date=end_date,
+                                                                       alarm_start_date=alarm_start_date,
+                                                                       data=data_future.result()))
+                                    for turbine, data_future in self._prefetch_turbines(
+                                        prefetcher, farm_code, todo_lis[i_farm], start_date=start_date,
+                                        end_date=end_date, alarm_start_date=alarm_start_date))
+                elif executor is None:
+                    turbine_rets = ((turbine, *self._run_local_turbine(farm_code, turbine, start_date=start_date,
+                                                                       end_date=end_date,
+                                                                       alarm_start_date=alarm_start_date))
+                                    for turbine in todo_lis[i_farm])
+                else:
+                    turbine_rets = ((turbine, *self._wait_turbine(farm_code, turbine, future))
+                                    for turbine, future in farm_futures[i_farm])
+
+                failed = []
+                for turbine, ret, error, state in turbine_rets:
+                    print(turbine)
+                    if error is not None:
+                        # 失败的机组不记录，重新运行时再次计算
+                        failed.append(turbine)
+                        continue
+                    ledger.mark_computed(farm_code, turbine, ret, state)
+                    if ret is not None and self.is_to_db:
+                        upload_turbine_dir = self.upload_root_dir + f'/{farm_code}/{turbine}'
+                        pending.append(self._submit_result(farm_code, turbine, ret, upload_turbine_dir))
+
+                # 风场级计算在该风场所有机组完成后执行
+                local_file_path = os.path.join(farm_code, farm_code+'_all')
+                one_farm_fig = os.path.join(self.IMAGE_FILES_PATH, local_file_path)
+                os.makedirs(one_farm_fig, exist_ok=True)
 
-                result_dicts.append(result_dict)
+                upload_turbine_dir = self.upload_root_dir + f'/{farm_code}/{farm_code}_all'
+                if (farm_code, 'farm') in done and len(todo_lis[i_farm]) == 0:
+                    self._resume_result(farm_code, 'farm', done[(farm_code, 'farm')], upload_turbine_dir, pending)
+                else:
+                    with metrics_stage(self.metrics, 'farm_compute', farm_code=farm_code):
+                        ret = self.run_farm(farm_code, one_farm_fig, start_date=start_date,
+                                            end_date=end_date, alarm_start_date=alarm_start_date)
+                    if failed:
+                        # 风场结果缺少失败机组的数据，不记录，重新运行时在这些机组完成后重新计算
+                        logger.warning(f'[{self.MODEL_NAME}] 风场{farm_code}有{len(failed)}台机组计算失败：'
+                                       f'{failed}，风场计算结果不记入运行记录')
+                    else:
+                        ledger.mark_computed(farm_code, 'farm', ret)
+                    if ret is not None and self.is_to_db:
+                        pending.append(self._submit_result(farm_code, 'farm', ret, upload_turbine_dir))
+
+                if self.is_to_db:
+                    # 等待该风场图片上传完成后入库
+                    result_dicts = self._collect_results(pending)
+                    ledger.mark_uploaded(result_dicts)
+                    self.handle_model_result(result_dicts)
+                    ledger.mark_written(result_dicts)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+            if prefetcher is not None:
+                prefetcher.shutdown(cancel_futures=True)
 
-        # 结果数据入库
-        if self.is_to_db and len(result_dicts) > 0:
-            logger.info('结果数据入库')
-            self.handle_model_result(result_dicts)
-            # 上传文件
+        if self.is_to_db:
+            self.uploader.close()
             self.sftp.close()
             self.ssh.close()
 
+        if self.is_to_db and self.result_sink.written > 0:
+            logger.info(f'结果数据入库{self.result_sink.written}条')
         else:
             logger.info('结果无需入库')
+        dispose_engines()
 
         e = time.time()
+        self.metrics.log_summary()
+        report_file = self.metrics.to_json(
+            os.path.join(self.report_dir, f'{self.MODEL_NAME}_{model_run_date}_{int(all_start_s)}.json'),
+            model_name=self.MODEL_NAME, run_date=model_run_date, start_time=now,
+            total_seconds=round(e - all_start_s, 3))
+        logger.info(f'运行报告：{report_file}')
         print(f"整个脚本运行时间：{round((e - all_start_s) / 60, 3)}分钟")
         print('================================================= 执行完毕 =======================================')
@@ -1,54 +1,148 @@
 import datetime
+import os
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import quote
 
 import pandas as pd
-from sqlalchemy import create_engine
 
-from mydatatools.read_config import *
+from mydatatools import read_config as config
+from mydatatools.data_cache import DataCache, cache_days
+from mydatatools.db_pool import get_engine, dispose_engines, get_table_columns
+from mydatatools.fast_reader import read_sql_fast
+from mydatatools.fleet_catalog import get_fleet_catalog
+from mydatatools.memmap_store import MemmapStore, write_memmap
+from mydatatools.run_metrics import metrics_stage
+from mydatatools.single_flight import get_single_flight
+
+# 未传入参数时读取配置文件中的默认值；配置在首次使用时读取，参数显式传入None时保持原有含义
+_DEFAULT = object()
 
 
 class MyDataTools(object):
     """
     明阳量云集控数据获取工具
     """
-    def __init__(self, ibdb_info=None, mysqldb_info=None, **kwargs):
+    def __init__(self, ibdb_info=None, mysqldb_info=None, metrics=None, **kwargs):
 
         if ibdb_info is None:
             self.ibdb_info = {
-                'user': IB_USER,
-                'password': quote(IB_PASSWORD),
-                'host': IB_HOST,
-                'port': IB_PORT,
+                'user': config.IB_USER,
+                'password': quote(config.IB_PASSWORD),
+                'host': config.IB_HOST,
+                'port': config.IB_PORT,
             }
         else:
             self.ibdb_info = ibdb_info
 
         if mysqldb_info is None:
             self.mysqldb_info = {
-                'user': BASE_USER,
-                'password': quote(BASE_PASSWORD),
-                'host': BASE_HOST,
-                'port': BASE_PORT,
-                'database': BASE_DB
+                'user': config.BASE_USER,
+                'password': quote(config.BASE_PASSWORD),
+                'host': config.BASE_HOST,
+                'port': config.BASE_PORT,
+                'database': config.BASE_DB
             }
         else:
             self.mysqldb_info = mysqldb_info
 
-        if not IB_TURBINE_TYPE:
-            # 风机基础信息表
+        # 风机基础信息、点表信息及其索引均在首次使用时加载
+        self._turbine_base_info = None
+        self._all_map_data = None
+        self._map_index = None
+        self._model_by_turbine = None
+        # 已解析的机组点表映射
+        self._tag_map_cache = {}
+        self._data_cache = None
+        # RunMetrics实例，给定时记录每次get_data的耗时和行数
+        self.metrics = metrics
+
+        self.kwargs = kwargs
+
+    @staticmethod
+    def close():
+        """
+        释放进程内共享的数据库连接池，任务结束时调用
+        """
+        dispose_engines()
+
+    @property
+    def turbine_base_info(self):
+        """
+        风机基础信息表
+        """
+        if self._turbine_base_info is None:
             sqlstr = "select * from tb_wind_base_wtgs;"
-            engine_mysql = create_engine(
-                'mysql+pymysql://%(user)s:%(password)s@%(host)s:%(port)s/%(database)s?charset=utf8' % self.mysqldb_info
-            )
-            self.turbine_base_info = pd.read_sql_query(sqlstr, engine_mysql)
+            engine_mysql = get_engine(self.mysqldb_info)
+            self._turbine_base_info = pd.read_sql_query(sqlstr, engine_mysql)
+        return self._turbine_base_info
 
-        # 点表信息
-        # 测试先按照文件读入，后续可以录入数据库进行维护
-        map_table_path = os.path.join(".", '点表映射汇总表.csv')
-        self.all_map_data = pd.read_csv(map_table_path)
-        self.all_map_data[['FARM_CODE', 'TURBINE_CODE']] = self.all_map_data[['FARM_CODE', 'TURBINE_CODE']].astype('str')
+    @property
+    def all_map_data(self):
+        """
+        点表信息
+        """
+        if self._all_map_data is None:
+            # 测试先按照文件读入，后续可以录入数据库进行维护
+            map_table_path = os.path.join(".", '点表映射汇总表.csv')
+            all_map_data = pd.read_csv(map_table_path)
+            all_map_data[['FARM_CODE', 'TURBINE_CODE']] = all_map_data[['FARM_CODE', 'TURBINE_CODE']].astype('str')
+            self._all_map_data = all_map_data
+        return self._all_map_data
 
-        self.kwargs = kwargs
+    @property
+    def data_cache(self):
+        """
+        get_data本地磁盘缓存
+        """
+        if self._data_cache is None:
+            self._data_cache = DataCache(config.CACHE_DIR, config.CACHE_MAX_SIZE_MB * 1024 * 1024)
+        return self._data_cache
+
+    @property
+    def map_index(self):
+        """
+        将点表映射表预先编译为哈希索引，点表解析只需查字典
+        """
+        if self._map_index is None:
+            index = {'turbine': {}, 'farm_type': {}, 'type': {}, 'tag_by_type_name': {}, 'dtype_by_name': {}}
+            df = self.all_map_data
+            for farm_code, turbine_code, t_type, name, tag in zip(df['FARM_CODE'].tolist(),
+                                                                  df['TURBINE_CODE'].tolist(),
+                                                                  df['TYPE'].tolist(),
+                                                                  df['GENERAL_NAME_CH'].tolist(),
+                                                                  df['TAG_NAME_EN'].tolist()):
+                tag_notnull = pd.notnull(tag)
+                for key_index, key in ((index['turbine'], turbine_code),
+                                       (index['farm_type'], (farm_code, t_type)),
+                                       (index['type'], t_type)):
+                    tag_map = key_index.setdefault(key, {})
+                    if tag_notnull:
+                        tag_map[name] = tag
+                index['tag_by_type_name'].setdefault((t_type, name), tag)
+            index['farm_codes'] = set(df['FARM_CODE'].tolist())
+
+            # 点表映射表中可选的DTYPE列，按通用名称指定读取后的数据类型
+            if 'DTYPE' in df.columns:
+                for name, dtype in zip(df['GENERAL_NAME_CH'].tolist(), df['DTYPE'].tolist()):
+                    if pd.notnull(dtype):
+                        index['dtype_by_name'][name] = dtype
+            self._map_index = index
+        return self._map_index
+
+    @property
+    def model_by_turbine(self):
+        """
+        风机基础信息索引：机组编号 -> 机型列表
+        """
+        if self._model_by_turbine is None:
+            model_by_turbine = {}
+            for code, model in zip(self.turbine_base_info['CODE_'].tolist(),
+                                   self.turbine_base_info['MODEL_'].tolist()):
+                models = model_by_turbine.setdefault(code, [])
+                if model not in models:
+                    models.append(model)
+            self._model_by_turbine = model_by_turbine
+        return self._model_by_turbine
 
     def get_type_by_turbine(self, farm_code, turbine_code):
         """
@@ -60,76 +154,75 @@ class MyDataTools(object):
         if len(turbine_code) <= 3:
             turbine_code = farm_code + turbine_code.zfill(3)
 
-        df_turbine = self.turbine_base_info.query('CODE_ == @turbine_code')
-        if len(df_turbine) == 0:
+        types = self.model_by_turbine.get(turbine_code, [])
+        if len(types) == 0:
             result = '未查询到{}机组信息'.format(turbine_code)
+        elif len(types) > 1:
+            types_str = ','.join(types)
+            result = f'机组{turbine_code}存在多个机型{types_str}'
         else:
-            types = df_turbine['MODEL_'].unique().tolist()
-            if len(types) > 1:
-                types_str = ','.join(types)
-                result = f'机组{turbine_code}存在多个机型{types_str}'
-            else:
-                result = types[0]
+            result = types[0]
         return result
 
     def get_tag_map_by_type(self, turbine_type):
         """
         通过机型返回通用机型对应的点表映射dict
         """
-        df_map = self.all_map_data.query('TYPE == @turbine_type')
-        if len(df_map) == 0:
+        if turbine_type not in self.map_index['type']:
             print('未查询到{}机型点表信息'.format(turbine_type))
             return {}
-        else:
-            df_map.set_index('GENERAL_NAME_CH', inplace=True, drop=True)
-            df_map = df_map[df_map['TAG_NAME_EN'].notnull()]
-            return df_map['TAG_NAME_EN'].to_dict()
+        return dict(self.map_index['type'][turbine_type])
 
     def get_tag_map_by_farm_type(self, farm_code, type):
         """
         通过机型返回通用机型对应的点表映射dict
         """
-        df_map = self.all_map_data.query('FARM_CODE == @farm_code')
-        df_map = df_map.query('TYPE == @type')
-        if len(df_map) == 0:
+        if (farm_code, type) not in self.map_index['farm_type']:
             print('未查询到风场{}机型{}的点表信息'.format(farm_code, type))
             return {}
-        else:
-            df_map.set_index('GENERAL_NAME_CH', inplace=True, drop=True)
-            df_map = df_map[df_map['TAG_NAME_EN'].notnull()]
-            return df_map['TAG_NAME_EN'].to_dict()
+        return dict(self.map_index['farm_type'][(farm_code, type)])
 
     def get_tag_map_by_turbine_code(self, turbine_code):
         """
         通过机型返回通用机型对应的点表映射dict
         """
-        df_map = self.all_map_data.query('TURBINE_CODE == @turbine_code')
-        if len(df_map) == 0:
+        if turbine_code not in self.map_index['turbine']:
             print('未查询到机组编号{}的点表信息'.format(turbine_code))
             return {}
-        else:
-            df_map.set_index('GENERAL_NAME_CH', inplace=True, drop=True)
-            df_map = df_map[df_map['TAG_NAME_EN'].notnull()]
-            return df_map['TAG_NAME_EN'].to_dict()
+        return dict(self.map_index['turbine'][turbine_code])
 
     def get_tag_map(self, farm_code, turbine_code):
         """
-        根据风场，风机查询通用字段名与点表的对应关系dict
+        根据风场，风机查询通用字段名与点表的对应关系dict，结果按机组缓存
         """
         if len(turbine_code) <= 3:
             turbine_code = farm_code + turbine_code.zfill(3)
+        key = (farm_code, turbine_code)
+        if key not in self._tag_map_cache:
+            self._tag_map_cache[key] = self._resolve_tag_map(farm_code, turbine_code)
+        return dict(self._tag_map_cache[key])
+
+    def _resolve_tag_map(self, farm_code, turbine_code):
         # 1，优先按照自定义风机进行查询
-        if turbine_code in self.all_map_data['TURBINE_CODE'].unique():
+        if turbine_code in self.map_index['turbine']:
             return self.get_tag_map_by_turbine_code(turbine_code)
         # 2，优先按照自定义风场进行查询
-        if farm_code in self.all_map_data['FARM_CODE'].unique():
+        if farm_code in self.map_index['farm_codes']:
             t_type = self.get_type_by_turbine(farm_code, turbine_code)
             return self.get_tag_map_by_farm_type(farm_code, t_type)
         # 3，最后按照通用机型查询。
-        t_type = IB_TURBINE_TYPE or self.get_type_by_turbine(farm_code, turbine_code)
+        t_type = config.IB_TURBINE_TYPE or self.get_type_by_turbine(farm_code, turbine_code)
 
         return self.get_tag_map_by_type(t_type)
 
+    def get_fleet_catalog(self, ttl=None):
+        """
+        风场机组目录：由风机基础信息表和点表映射表生成 风场 -> 机组 -> 机型，进程内缓存，过期后重新查询
+        ttl：缓存有效期(秒)，默认读取配置cache.fleet_ttl
+        return：FleetCatalog，例：catalog.get_turbines('30000') -> ['001', '002', ...]
+        """
+        return get_fleet_catalog(self.mysqldb_info, self.all_map_data, ttl=ttl)
+
     def get_data_old(self, farm_code, turbine_code, col_names=None, start_date=None, end_date=None, db_yesr=None):
         """
         获取指定机组，指定数据列col，开始结束时间段对应的数据
@@ -145,9 +238,7 @@ class MyDataTools(object):
                 else:
                     db_yesr = str(datetime.date.today().year)
         self.ibdb_info['database'] = 'db' + farm_code + '_' + db_yesr
-        engine = create_engine(
-            'mysql+pymysql://%(user)s:%(password)s@%(host)s:%(port)s/%(database)s?charset=utf8' % self.ibdb_info
-        )
+        engine = get_engine(self.ibdb_info)
         table_name = 't' + farm_code + turbine_code + '_all'
 
         # 根据col_names 映射为实际的点表tags
@@ -169,10 +260,7 @@ class MyDataTools(object):
 
 
         # 查询数据库已有字段名,对需要的tag进行校验
-        sql_column_names = f"SELECT * FROM {table_name} limit 1;"
-        df_limit1 = pd.read_sql_query(sql_column_names, engine)
-        # df_limit1.to_csv(f'{table_name}_limit1.csv')
-        all_exist_tags = df_limit1.columns
+        all_exist_tags = get_table_columns(engine, self.ibdb_info['database'], table_name)
         valid_lis = [t for t in tags_lis if t in all_exist_tags]
         not_exist_tags = [t for t in tags_lis if t not in all_exist_tags]
         if len(not_exist_tags) > 0:
@@ -209,7 +297,9 @@ class MyDataTools(object):
         df.set_index('real_time', drop=True, inplace=True)
         return df
 
-    def field_format(self, field, str_format=IB_FIELD_FORMAT):
+    def field_format(self, field, str_format=_DEFAULT):
+        if str_format is _DEFAULT:
+            str_format = config.IB_FIELD_FORMAT
         return str_format.format(field) if str_format else field
 
     def handle_database(self, farm_code, start_date, end_date,):
@@ -223,23 +313,27 @@ class MyDataTools(object):
                 db_yesr = str(datetime.date.today().year)
         return 'db' + farm_code + '_' + db_yesr
 
-    def get_data(self, farm_code, turbine_code, db_yesr=IB_DB, table_name=IB_TABLE, col_names=None, start_date=None,
-                 end_date=None, field_format=IB_FIELD_FORMAT):
+    def _prepare_query(self, farm_code, turbine_code, db_yesr=_DEFAULT, table_name=_DEFAULT, col_names=None,
+                       start_date=None, end_date=None, field_format=_DEFAULT, dtypes=None):
         """
-        获取指定机组，指定数据列col，开始结束时间段对应的数据
-        col_names == 'all'时，获取全部通用字段数据，
-        tags_names == 'all'时，获取所有表里的字段数据。
+        解析库名、表名以及需要查询的点表字段，生成查询计划
+        db_yesr、table_name、field_format未传入时读取配置conn_IB中的db、table_name、field_format
+        return：查询计划dict，字段名均无效时返回None
         """
-        mysqldb_info = self.ibdb_info
-        mysqldb_info['database'] = db_yesr or self.handle_database(farm_code, start_date, end_date)
-        engine = create_engine(
-            'mysql+pymysql://%(user)s:%(password)s@%(host)s:%(port)s/%(database)s?charset=utf8' % mysqldb_info
-        )
+        if db_yesr is _DEFAULT:
+            db_yesr = config.IB_DB
+        if table_name is _DEFAULT:
+            table_name = config.IB_TABLE
+        if field_format is _DEFAULT:
+            field_format = config.IB_FIELD_FORMAT
+        # 每次调用使用独立的连接信息，并发调用不修改实例共享的ibdb_info
+        mysqldb_info = dict(self.ibdb_info, database=db_yesr or self.handle_database(farm_code, start_date, end_date))
+        engine = get_engine(mysqldb_info)
         if not table_name:
             table_name = farm_code + turbine_code
 
-        if IB_TABLE_FORMAT:
-            table_name = IB_TABLE_FORMAT.format(table_name)
+        if config.IB_TABLE_FORMAT:
+            table_name = config.IB_TABLE_FORMAT.format(table_name)
 
         # 根据col_names 映射为实际的点表tags
         tag_maps_all = self.get_tag_map(farm_code, turbine_code)
@@ -254,28 +348,144 @@ class MyDataTools(object):
                 print('warring 部分给定的字段名有误。')
         if len(tags_lis) == 0:
             print('请输入准确的字段名称！')
-            return pd.DataFrame()
+            return None
 
         tags_lis = [self.field_format(i, field_format) for i in tags_lis]
 
         # 查询数据库已有字段名,对需要的tag进行校验
-        sql_column_names = f"SELECT * FROM {table_name} limit 1;"
-        df_limit1 = pd.read_sql_query(sql_column_names, engine)
-        all_exist_tags = df_limit1.columns
+        all_exist_tags = get_table_columns(engine, mysqldb_info['database'], table_name)
         valid_lis = [t for t in tags_lis if t in all_exist_tags]
         not_exist_tags = [t for t in tags_lis if t not in all_exist_tags]
         if len(not_exist_tags) > 0:
             print('warring! 部分字段对应的点表名数据库中不存在：' + '，'.join(not_exist_tags))
 
-        tag_time = self.all_map_data[(self.all_map_data["TYPE"] == IB_TURBINE_TYPE) &
-                                     (self.all_map_data["GENERAL_NAME_CH"] == "时间")]["TAG_NAME_EN"].iloc[0]
-        tag_turbine_id = self.all_map_data[(self.all_map_data["TYPE"] == IB_TURBINE_TYPE) &
-                                           (self.all_map_data["GENERAL_NAME_CH"] == "风机编号")]["TAG_NAME_EN"].iloc[0]
-        tags_lis = [tag_time] + valid_lis
-        tags = ','.join(tags_lis)
+        tag_time = self.map_index['tag_by_type_name'][(config.IB_TURBINE_TYPE, "时间")]
+        tag_turbine_id = self.map_index['tag_by_type_name'][(config.IB_TURBINE_TYPE, "风机编号")]
+        # 时间字段总是单独查询，col_names为None时不重复选择
+        valid_lis = [t for t in valid_lis if t != tag_time]
 
-        turbine_id = farm_code + turbine_code
-        sqlstr = f"SELECT {tags} FROM {table_name} where {tag_turbine_id}='{turbine_id}'"
+        # 这里读出来的列名是点表，需要转换为通用名称
+        rename_dict = {self.field_format(v, field_format) if m not in ["时间", "风机编号"] else v: m
+                       for m, v in tag_maps_all.items()}
+
+        # 数据类型策略：点表映射表DTYPE列 < 参数dtypes；dtypes == 'compact'时浮点列统一转为float32
+        if dtypes is None:
+            dtypes = self.kwargs.get('dtypes')
+        compact = dtypes == 'compact'
+        name_dtypes = dict(self.map_index['dtype_by_name'])
+        if isinstance(dtypes, dict):
+            name_dtypes.update(dtypes)
+        tag_dtypes = {t: name_dtypes[rename_dict[t]] for t in valid_lis
+                      if t in rename_dict and rename_dict[t] in name_dtypes}
+        return {
+            'engine': engine,
+            'server': f"{mysqldb_info['host']}:{mysqldb_info['port']}",
+            'database': mysqldb_info['database'],
+            'table_name': table_name,
+            'tag_time': tag_time,
+            'tag_turbine_id': tag_turbine_id,
+            'turbine_id': farm_code + turbine_code,
+            'tags': valid_lis,
+            'rename_dict': rename_dict,
+            'dtypes': tag_dtypes,
+            'compact': compact,
+        }
+
+    @staticmethod
+    def _resample_plan(plan, resample, agg=None):
+        """
+        在查询计划中加入按时间分桶的聚合，由数据库完成降采样
+        resample：时间桶宽度，例：'1min'，'10min'
+        agg：聚合方式，{通用名称: 'mean'/'min'/'max'/'count'/'sum'/'first'/'last'}，或对所有字段生效的字符串，默认mean
+        """
+        seconds = int(pd.Timedelta(resample).total_seconds())
+        if seconds <= 0:
+            raise ValueError(f'resample参数有误：{resample}')
+        sql_funcs = {'mean': 'AVG', 'min': 'MIN', 'max': 'MAX', 'count': 'COUNT', 'sum': 'SUM'}
+        tag_time = plan['tag_time']
+        # 以1970-01-01为起点按本地时间分桶，避免UNIX_TIMESTAMP带来的时区偏移
+        bucket = (f"DATE_ADD('1970-01-01', INTERVAL FLOOR(TIMESTAMPDIFF(SECOND, '1970-01-01', {tag_time}) / {seconds})"
+                  f" * {seconds} SECOND)")
+        selects = [f'{bucket} AS {tag_time}']
+        to_numeric = []
+        for tag in plan['tags']:
+            name = plan['rename_dict'].get(tag, tag)
+            how = (agg.get(name, 'mean') if isinstance(agg, dict) else agg) or 'mean'
+            if how in sql_funcs:
+                selects.append(f'{sql_funcs[how]}({tag}) AS {tag}')
+            elif how in ('first', 'last'):
+                order = 'ASC' if how == 'first' else 'DESC'
+                selects.append(f"SUBSTRING_INDEX(GROUP_CONCAT({tag} ORDER BY {tag_time} {order}), ',', 1) AS {tag}")
+                to_numeric.append(tag)
+            else:
+                raise ValueError(f'不支持的聚合方式：{how}')
+        return dict(plan, select=','.join(selects), group_by=True, resample_seconds=seconds, to_numeric=to_numeric)
+
+    @staticmethod
+    def _cast_chunk(df, plan):
+        """
+        按查询计划中的数据类型策略转换一块原始数据的列类型
+        """
+        # first/last聚合结果以字符串返回，转换为数值
+        for col in plan.get('to_numeric', []):
+            if col in df.columns:
+                try:
+                    df[col] = pd.to_numeric(df[col])
+                except (ValueError, TypeError):
+                    pass
+        if plan['compact']:
+            for col in plan['tags']:
+                if col in df.columns and df[col].dtype == 'float64':
+                    df[col] = df[col].astype('float32')
+        for col, dtype in plan['dtypes'].items():
+            if col not in df.columns:
+                continue
+            try:
+                df[col] = df[col].astype(dtype)
+            except (ValueError, TypeError):
+                # 整型列中存在空值时，改用可空整型
+                if isinstance(dtype, str) and dtype.startswith(('int', 'uint')):
+                    df[col] = df[col].astype(dtype.capitalize().replace('Uint', 'UInt'))
+        return df
+
+    @staticmethod
+    def _concat_frames(dfs, plan=None):
+        """
+        按顺序拼接多块数据，忽略空块；分块转换为category的列拼接后重新转换
+        """
+        not_empty = [df for df in dfs if len(df) > 0]
+        if len(not_empty) == 0:
+            return dfs[0]
+        df = pd.concat(not_empty, ignore_index=True) if len(not_empty) > 1 else not_empty[0]
+        if plan is not None:
+            for col, dtype in plan['dtypes'].items():
+                if dtype == 'category' and col in df.columns and df[col].dtype != 'category':
+                    df[col] = df[col].astype('category')
+        return df
+
+    def _read_sql(self, plan, sqlstr, chunksize=100000):
+        """
+        执行查询；需要转换数据类型时分块读取，每块读取后立即转换，降低内存峰值
+        """
+        if plan.get('fast_reader'):
+            # 驱动游标直接写入numpy列缓冲，整体读取后再转换类型
+            return self._cast_chunk(read_sql_fast(sqlstr, plan['engine']), plan)
+        if not plan['dtypes'] and not plan['compact']:
+            return self._cast_chunk(pd.read_sql_query(sqlstr, plan['engine']), plan)
+        with plan['engine'].connect().execution_options(stream_results=True) as conn:
+            dfs = [self._cast_chunk(chunk, plan) for chunk in pd.read_sql_query(sqlstr, conn, chunksize=chunksize)]
+        if len(dfs) == 0:
+            return self._cast_chunk(pd.DataFrame(columns=[plan['tag_time']] + plan['tags']), plan)
+        return self._concat_frames(dfs, plan)
+
+    @staticmethod
+    def _build_sql(plan, start_date=None, end_date=None):
+        """
+        根据查询计划拼接查询语句，时间范围为[start_date, end_date)
+        """
+        tag_time = plan['tag_time']
+        tags = plan.get('select') or ','.join([tag_time] + plan['tags'])
+        sqlstr = f"SELECT {tags} FROM {plan['table_name']} where {plan['tag_turbine_id']}='{plan['turbine_id']}'"
 
         # 调试用，获取所有数据
         # sqlstr = f"SELECT * FROM {table_name}"
@@ -284,12 +494,145 @@ class MyDataTools(object):
             sqlstr = sqlstr + f" AND {tag_time} >= '{start_date}'"
         if end_date is not None:
             sqlstr = sqlstr + f" AND {tag_time} < '{end_date}'"
-        sqlstr = sqlstr + ';'
-        df = pd.read_sql_query(sqlstr, engine)
-        # 这里读出来的列名是点表，需要转换为通用名称
-        # map_dict = {}
-        rename_dict = {self.field_format(v, field_format) if m not in ["时间", "风机编号"] else v: m for m, v in tag_maps_all.items()}
-        df.rename(columns=rename_dict, inplace=True)
+        if plan.get('group_by'):
+            # GROUP BY中同名字段优先解析为表字段而非别名，这里按位置引用时间桶
+            sqlstr = sqlstr + " GROUP BY 1 ORDER BY 1"
+        return sqlstr + ';'
+
+    @staticmethod
+    def _split_time_range(start_date, end_date, slice_freq):
+        """
+        将[start_date, end_date)按slice_freq切分为多个连续时间片
+        slice_freq：时间片宽度，例：'1D'，'6h'
+        return：[(start, end), ...]
+        """
+        step = pd.Timedelta(slice_freq)
+        start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        bounds = [start_date]
+        cur = start + step
+        while cur < end:
+            bounds.append(cur.strftime('%Y-%m-%d %H:%M:%S'))
+            cur = cur + step
+        bounds.append(end_date)
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def _read_sliced(self, plan, start_date, end_date, slice_freq, max_workers):
+        """
+        按时间片并发查询，结果按时间片顺序拼接
+        """
+        slices = self._split_time_range(start_date, end_date, slice_freq)
+        if len(slices) <= 1:
+            return self._read_sql(plan, self._build_sql(plan, start_date, end_date))
+
+        def read_one(time_range):
+            return self._read_sql(plan, self._build_sql(plan, *time_range))
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(slices))) as executor:
+            dfs = list(executor.map(read_one, slices))
+        return self._concat_frames(dfs, plan)
+
+    @staticmethod
+    def _join_groups(dfs, tag_time):
+        """
+        按时间将各字段分组的查询结果横向拼接，行顺序与第一组一致；
+        同一时间有多行时按时间 + 该时间内的序号对齐
+        """
+        base = dfs[0]
+        if base[tag_time].is_unique:
+            def key(df):
+                return pd.Index(df[tag_time])
+        else:
+            def key(df):
+                return pd.MultiIndex.from_arrays([df[tag_time], df.groupby(tag_time, sort=False).cumcount()])
+        index = key(base)
+        parts = [base.set_axis(index, axis=0)]
+        for df in dfs[1:]:
+            parts.append(df.drop(columns=tag_time).set_axis(key(df), axis=0).reindex(index))
+        return pd.concat(parts, axis=1).reset_index(drop=True)
+
+    def _read_grouped(self, plan, start_date, end_date, slice_freq=None, max_workers=4):
+        """
+        将字段按column_group_size分组，各组（均包含时间字段，按机组编号过滤）在连接池的不同连接上并发查询，
+        再按时间拼接
+        """
+        size = plan['column_group_size']
+        tags = plan['tags']
+        groups = [tags[i:i + size] for i in range(0, len(tags), size)]
+
+        def read_one(group):
+            sub_plan = dict(plan, tags=group, column_group_size=None)
+            # 组间已并发，组内的时间片依次查询
+            return self._read_range(sub_plan, start_date, end_date, slice_freq, 1)
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(groups))) as executor:
+            dfs = list(executor.map(read_one, groups))
+        return self._join_groups(dfs, plan['tag_time'])
+
+    def _read_range(self, plan, start_date, end_date, slice_freq=None, max_workers=4):
+        """
+        直接从数据库读取一段时间的原始数据
+        """
+        # 按时间分桶聚合的查询语句包含全部字段，不分组
+        if plan.get('column_group_size') and len(plan['tags']) > plan['column_group_size'] \
+                and not plan.get('group_by'):
+            return self._read_grouped(plan, start_date, end_date, slice_freq, max_workers)
+        if slice_freq and start_date is not None and end_date is not None:
+            return self._read_sliced(plan, start_date, end_date, slice_freq, max_workers)
+        return self._read_sql(plan, self._build_sql(plan, start_date, end_date))
+
+    def _read_cached(self, plan, start_date, end_date, slice_freq=None, max_workers=4):
+        """
+        优先从本地缓存读取完整日期的数据，只查询缺失的日期与字段，首尾不足一天的部分直接查询数据库
+        """
+        days, first_day, last_day = cache_days(start_date, end_date, settle_hours=config.CACHE_SETTLE_HOURS)
+        if len(days) == 0:
+            return self._read_range(plan, start_date, end_date, slice_freq, max_workers)
+
+        key = (plan['server'], plan['database'], plan['table_name'], plan['turbine_id'])
+        tag_time, tags = plan['tag_time'], plan['tags']
+        day_fmt = '%Y-%m-%d %H:%M:%S'
+        one_day = pd.Timedelta(days=1)
+
+        # 缺失字段相同的连续日期合并为一次查询；分区因源数据变化作废时再补一次
+        for _ in range(2):
+            runs = []
+            for day in days:
+                missing = tuple(self.data_cache.missing_tags(key, day, tags))
+                if not missing:
+                    continue
+                if runs and runs[-1][1] == missing and runs[-1][0][-1] + one_day == day:
+                    runs[-1][0].append(day)
+                else:
+                    runs.append(([day], missing))
+            if not runs:
+                break
+            for run_days, missing in runs:
+                # 缓存中保存原始类型，读取后再按数据类型策略转换
+                sub_plan = dict(plan, tags=list(missing), dtypes={}, compact=False)
+                df = self._read_range(sub_plan, run_days[0].strftime(day_fmt),
+                                      (run_days[-1] + one_day).strftime(day_fmt), slice_freq, max_workers)
+                self.data_cache.write(key, run_days, df, tag_time, list(missing))
+
+        parts = []
+        if pd.Timestamp(start_date) < first_day:
+            parts.append(self._read_range(plan, start_date, first_day.strftime(day_fmt), slice_freq, max_workers))
+        cached, lost_days = self.data_cache.read(key, days, tag_time, tags)
+        if lost_days:
+            # 读取期间分区被其他进程淘汰或作废，整段完整日期改为查询数据库
+            cached = self._read_range(dict(plan, dtypes={}, compact=False), first_day.strftime(day_fmt),
+                                      last_day.strftime(day_fmt), slice_freq, max_workers)
+        parts.append(self._cast_chunk(cached, plan))
+        self.data_cache.evict(key, days)
+        if last_day < pd.Timestamp(end_date):
+            parts.append(self._read_range(plan, last_day.strftime(day_fmt), end_date, slice_freq, max_workers))
+        return self._concat_frames(parts, plan)
+
+    @staticmethod
+    def _format_frame(df, plan):
+        """
+        点表列名转换为通用名称，并设置时间索引
+        """
+        df.rename(columns=plan['rename_dict'], inplace=True)
         # 数据预处理
         # df = df[~df.duplicated(subset=['sampling_time', 'point_name', 'sampling_frequency'], keep='last')]
         # 设置时间索引
@@ -297,6 +640,215 @@ class MyDataTools(object):
         df.set_index("时间", drop=True, inplace=True)
         return df
 
+    def get_data(self, farm_code, turbine_code, db_yesr=_DEFAULT, table_name=_DEFAULT, col_names=None, start_date=None,
+                 end_date=None, field_format=_DEFAULT, slice_freq=None, max_workers=4, use_cache=None,
+                 dtypes=None, resample=None, agg=None, single_flight=None, column_group_size=None,
+                 fast_reader=None):
+        """
+        获取指定机组，指定数据列col，开始结束时间段对应的数据
+        col_names == 'all'时，获取全部通用字段数据，
+        tags_names == 'all'时，获取所有表里的字段数据。
+        slice_freq：时间片宽度，例：'1D'，给定且开始结束时间都不为空时，按时间片并发查询后按顺序拼接
+        max_workers：按时间片或字段分组查询时的最大并发数
+        use_cache：是否使用本地缓存，默认读取配置cache.enable；开始结束时间都不为空时生效
+        dtypes：数据类型策略，{通用名称: dtype}，例：{'运行模式': 'int8', '故障状态': 'category'}；
+                'compact' 浮点列统一读取为float32。点表映射表中有DTYPE列时按其指定类型转换
+        resample：降采样时间桶宽度，例：'10min'，给定时由数据库按时间分桶聚合，返回聚合后的数据（不使用本地缓存）
+        agg：降采样聚合方式，{通用名称: 'mean'/'min'/'max'/'count'/'sum'/'first'/'last'}，默认mean
+        column_group_size：字段分组宽度，例：50，给定且字段数更多时（如col_names=None读取宽表全部字段），
+                           字段按组并发查询（每组包含时间字段），再按时间拼接，并发数为max_workers
+        fast_reader：是否使用驱动游标直接读取为numpy列（结果与pd.read_sql_query一致），默认读取配置conn_IB.fast_reader
+        single_flight：是否合并进程内并发的相同请求，默认读取配置single_flight.enable；
+                       其他线程正在查询同一机组、同一时间范围且字段包含本次所需字段时，等待并共享其结果
+        """
+        with metrics_stage(self.metrics, 'get_data', farm_code=farm_code, turbine=turbine_code,
+                           resample=resample) as rec:
+            plan = self._prepare_query(farm_code, turbine_code, db_yesr=db_yesr, table_name=table_name,
+                                       col_names=col_names, start_date=start_date, end_date=end_date,
+                                       field_format=field_format, dtypes=dtypes)
+            if plan is None:
+                return pd.DataFrame()
+            if column_group_size is None:
+                column_group_size = self.kwargs.get('column_group_size')
+            plan['column_group_size'] = column_group_size
+            if fast_reader is None:
+                fast_reader = self.kwargs.get('fast_reader', config.IB_FAST_READER)
+            plan['fast_reader'] = fast_reader
+
+            def read(tags):
+                return self._read_plan(dict(plan, tags=tags), start_date, end_date, slice_freq, max_workers,
+                                       use_cache, resample, agg)
+
+            if single_flight is None:
+                single_flight = config.SINGLE_FLIGHT_ENABLE
+            if single_flight:
+                # 同一进程内相同请求（库/表/机组/时间范围/查询选项）同时只查询一次，字段合并后按各自字段取列
+                key = (str(plan['engine'].url), plan['database'], plan['table_name'], plan['turbine_id'],
+                       start_date, end_date, resample, repr(agg), repr(dtypes or self.kwargs.get('dtypes')))
+                df, shared = get_single_flight().do(key, plan['tags'], read)
+                if shared:
+                    df = self._cast_chunk(df.reindex(columns=[plan['tag_time']] + plan['tags']), plan)
+                    rec['shared'] = True
+            else:
+                df = read(plan['tags'])
+            df = self._format_frame(df, plan)
+            rec['rows'] = len(df)
+        return df
+
+    def _read_plan(self, plan, start_date, end_date, slice_freq=None, max_workers=4, use_cache=None, resample=None,
+                   agg=None):
+        """
+        按查询计划读取原始数据（点表列名），参数同get_data
+        """
+        if resample:
+            plan = self._resample_plan(plan, resample, agg)
+            # 本地缓存保存原始数据；时间片边界与时间桶不对齐时会拆开同一个桶，此时不按时间片查询
+            use_cache = False
+            if slice_freq and start_date is not None and (
+                    pd.Timedelta(slice_freq).total_seconds() % plan['resample_seconds'] != 0 or
+                    pd.Timestamp(start_date).floor(f"{plan['resample_seconds']}s") != pd.Timestamp(start_date)):
+                slice_freq = None
+
+        if use_cache is None:
+            use_cache = config.CACHE_ENABLE
+        if use_cache and start_date is not None and end_date is not None:
+            return self._read_cached(plan, start_date, end_date, slice_freq, max_workers)
+        return self._read_range(plan, start_date, end_date, slice_freq, max_workers)
+
+    def iter_data(self, farm_code, turbine_code, db_yesr=_DEFAULT, table_name=_DEFAULT, col_names=None, start_date=None,
+                  end_date=None, field_format=_DEFAULT, chunksize=100000, dtypes=None):
+        """
+        分块获取数据的生成器，参数同get_data
+        使用服务端游标（非缓冲）逐块读取，每块已完成列名转换并设置时间索引，适合大时间范围的数据做滚动统计
+        chunksize：每块的行数
+        """
+        plan = self._prepare_query(farm_code, turbine_code, db_yesr=db_yesr, table_name=table_name,
+                                   col_names=col_names, start_date=start_date, end_date=end_date,
+                                   field_format=field_format, dtypes=dtypes)
+        if plan is None:
+            return
+
+        sqlstr = self._build_sql(plan, start_date, end_date)
+        with plan['engine'].connect().execution_options(stream_results=True) as conn:
+            for chunk in pd.read_sql_query(sqlstr, conn, chunksize=chunksize):
+                yield self._format_frame(self._cast_chunk(chunk, plan), plan)
+
+    def iter_data_many(self, farm_code, turbine_codes, db_yesr=_DEFAULT, table_name=_DEFAULT, col_names=None,
+                       start_date=None, end_date=None, field_format=_DEFAULT, batch_size=20, chunksize=100000,
+                       dtypes=None):
+        """
+        批量获取同一风场多台机组的数据，逐台机组返回(turbine_code, df)的生成器
+        点表映射相同的机组合并为一条IN (...)查询，每条查询最多包含batch_size台机组，
+        结果按机组、时间排序后流式读取，每台机组读取完毕即返回，避免整个风场的数据同时驻留内存。
+        每台机组为单独一张表（table_name为空）时，退化为逐台调用get_data。
+        """
+        if table_name is _DEFAULT:
+            table_name = config.IB_TABLE
+        if not table_name:
+            for turbine_code in turbine_codes:
+                yield turbine_code, self.get_data(farm_code, turbine_code, db_yesr=db_yesr, table_name=table_name,
+                                                  col_names=col_names, start_date=start_date, end_date=end_date,
+                                                  field_format=field_format, dtypes=dtypes)
+            return
+
+        # 点表映射相同的机组可以合并查询
+        groups = {}
+        for turbine_code in turbine_codes:
+            key = tuple(self.get_tag_map(farm_code, turbine_code).items())
+            groups.setdefault(key, []).append(turbine_code)
+
+        for turbines in groups.values():
+            plan = self._prepare_query(farm_code, turbines[0], db_yesr=db_yesr, table_name=table_name,
+                                       col_names=col_names, start_date=start_date, end_date=end_date,
+                                       field_format=field_format, dtypes=dtypes)
+            if plan is None:
+                for turbine_code in turbines:
+                    yield turbine_code, pd.DataFrame()
+                continue
+            for i in range(0, len(turbines), batch_size):
+                yield from self._iter_batch(plan, farm_code, turbines[i:i + batch_size], start_date, end_date,
+                                            chunksize)
+
+    def _iter_batch(self, plan, farm_code, turbine_codes, start_date, end_date, chunksize):
+        """
+        一条IN (...)查询读取一批机组的数据，按机组拆分后逐台返回
+        """
+        id_to_turbine = {farm_code + t: t for t in turbine_codes}
+        tag_time, tag_turbine_id = plan['tag_time'], plan['tag_turbine_id']
+        tags = ','.join([f'{tag_turbine_id} AS _turbine_id', tag_time] + plan['tags'])
+        ids = ','.join(f"'{i}'" for i in id_to_turbine)
+        sqlstr = f"SELECT {tags} FROM {plan['table_name']} where {tag_turbine_id} IN ({ids})"
+        if start_date is not None:
+            sqlstr = sqlstr + f" AND {tag_time} >= '{start_date}'"
+        if end_date is not None:
+            sqlstr = sqlstr + f" AND {tag_time} < '{end_date}'"
+        sqlstr = sqlstr + f" ORDER BY {tag_turbine_id}, {tag_time};"
+
+        def build(parts):
+            df = self._concat_frames(parts, plan)
+            return self._format_frame(df.drop(columns='_turbine_id'), plan)
+
+        done = set()
+        cur_id, parts = None, []
+        with plan['engine'].connect().execution_options(stream_results=True) as conn:
+            for chunk in pd.read_sql_query(sqlstr, conn, chunksize=chunksize):
+                chunk['_turbine_id'] = chunk['_turbine_id'].astype(str)
+                chunk = self._cast_chunk(chunk, plan)
+                for turbine_id, part in chunk.groupby('_turbine_id', sort=False):
+                    if turbine_id != cur_id and parts:
+                        done.add(cur_id)
+                        yield id_to_turbine.get(cur_id, cur_id), build(parts)
+                        parts = []
+                    cur_id = turbine_id
+                    parts.append(part)
+        if parts:
+            done.add(cur_id)
+            yield id_to_turbine.get(cur_id, cur_id), build(parts)
+
+        # 查询范围内没有数据的机组返回空DataFrame
+        for turbine_id, turbine_code in id_to_turbine.items():
+            if turbine_id not in done:
+                empty = pd.DataFrame(columns=['_turbine_id', tag_time] + plan['tags'])
+                yield turbine_code, build([self._cast_chunk(empty, plan)])
+
+    def get_data_many(self, farm_code, turbine_codes, multi_index=False, **kwargs):
+        """
+        批量获取同一风场多台机组的数据，参数同iter_data_many
+        multi_index：False 返回{turbine_code: df}；True 返回以(风机, 时间)为索引的DataFrame
+        """
+        result = dict(self.iter_data_many(farm_code, turbine_codes, **kwargs))
+        if not multi_index:
+            return result
+        frames = {t: result[t] for t in turbine_codes if t in result and len(result[t]) > 0}
+        if len(frames) == 0:
+            return pd.DataFrame()
+        return pd.concat(frames, names=['风机', '时间'])
+
+    def export_memmap(self, path, farm_code, turbine_code, col_names=None, start_date=None, end_date=None, **kwargs):
+        """
+        将get_data的查询结果导出为按时间排序的定宽二进制列文件（目录path），供read_memmap/open_memmap反复读取
+        其他参数同get_data
+        return：path
+        """
+        df = self.get_data(farm_code, turbine_code, col_names=col_names, start_date=start_date, end_date=end_date,
+                           **kwargs)
+        return write_memmap(path, df)
+
+    @staticmethod
+    def open_memmap(path):
+        """
+        以numpy.memmap只读打开export_memmap导出的数据，多个进程共享同一份页缓存
+        return：MemmapStore，store.column(通用名称)为memmap数组，store.locate(start, end)为时间切片的行号范围
+        """
+        return MemmapStore(path)
+
+    @staticmethod
+    def read_memmap(path, start_date=None, end_date=None, col_names=None):
+        """
+        读取export_memmap导出的数据中[start_date, end_date)的部分，按时间二分查找定位，不做反序列化
+        return：以时间为索引的DataFrame，字符串列读取为category
+        """
+        return MemmapStore(path).to_frame(start_date, end_date, col_names)
 
     # def get_rated_power_by_turbine(self, farm, turbine_num):
     #     """
@@ -0,0 +1,161 @@
+import os
+import shutil
+import threading
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+
+TIME_FILE = '_time.npy'
+
+
+class DataCache(object):
+    """
+    get_data本地磁盘缓存
+    按 服务器/库/表/机组/日期 分区，每个分区内每个字段单独存为一个.npy列文件，时间列存为_time.npy，
+    各列文件按行对齐。只缓存完整的历史日期，超出容量时按最近访问时间淘汰分区。
+    """
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._size = None
+        self._lock = threading.Lock()
+
+    def _day_dir(self, key, day):
+        # key：(服务器host:port, 库, 表, 机组编号)
+        return os.path.join(self.root, *[quote(str(k), safe='') for k in key], day.strftime('%Y%m%d'))
+
+    @staticmethod
+    def _tag_file(day_dir, tag):
+        return os.path.join(day_dir, quote(tag, safe='') + '.npy')
+
+    def missing_tags(self, key, day, tags):
+        """
+        返回某天分区中尚未缓存的字段
+        """
+        day_dir = self._day_dir(key, day)
+        if not os.path.exists(os.path.join(day_dir, TIME_FILE)):
+            return list(tags)
+        return [t for t in tags if not os.path.exists(self._tag_file(day_dir, t))]
+
+    @staticmethod
+    def _save(path, arr):
+        # 先写临时文件再替换，避免并发读取到不完整的文件
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, arr, allow_pickle=True)
+        os.replace(tmp_path, path)
+        return os.path.getsize(path)
+
+    def write(self, key, days, df, tag_time, tags):
+        """
+        将查询结果按天拆分写入缓存，查询范围内没有数据的日期同样写入空分区
+        df：原始查询结果，列为tag_time + tags
+        """
+        times = pd.to_datetime(df[tag_time])
+        day_of_row = times.dt.normalize()
+        written = 0
+        for day in days:
+            mask = (day_of_row == day).to_numpy()
+            t = times[mask].to_numpy(dtype='datetime64[ns]')
+            order = np.argsort(t, kind='mergesort')
+            t = t[order]
+
+            day_dir = self._day_dir(key, day)
+            time_path = os.path.join(day_dir, TIME_FILE)
+            if os.path.exists(time_path):
+                old_t = np.load(time_path, allow_pickle=True)
+                if not np.array_equal(old_t, t):
+                    # 源数据已变化，已缓存的字段无法按行对齐，整个分区作废
+                    shutil.rmtree(day_dir, ignore_errors=True)
+            os.makedirs(day_dir, exist_ok=True)
+            if not os.path.exists(time_path):
+                written += self._save(time_path, t)
+            for tag in tags:
+                written += self._save(self._tag_file(day_dir, tag), df[tag].to_numpy()[mask][order])
+        # 写入后不立即淘汰，由调用方读取完毕后调用evict，避免淘汰本次将要读取的分区
+        with self._lock:
+            if self._size is not None:
+                self._size += written
+
+    def read(self, key, days, tag_time, tags):
+        """
+        从缓存读取多天数据，列为tag_time + tags
+        return：(DataFrame, 读取时分区已被删除（其他进程淘汰或作废）的日期列表)
+        """
+        frames, lost_days = [], []
+        for day in days:
+            day_dir = self._day_dir(key, day)
+            try:
+                t = np.load(os.path.join(day_dir, TIME_FILE), allow_pickle=True)
+                data = {tag_time: t}
+                for tag in tags:
+                    data[tag] = np.load(self._tag_file(day_dir, tag), allow_pickle=True)
+                # 更新分区访问时间，用于LRU淘汰
+                os.utime(day_dir)
+            except (OSError, ValueError, EOFError):
+                lost_days.append(day)
+                continue
+            if len(t) > 0:
+                frames.append(pd.DataFrame(data))
+        if len(frames) == 0:
+            return pd.DataFrame(columns=[tag_time] + list(tags)), lost_days
+        return pd.concat(frames, ignore_index=True), lost_days
+
+    def _partitions(self):
+        """
+        返回所有分区 [(最近访问时间, 大小, 路径), ...]
+        """
+        partitions = []
+        for dir_path, dir_names, file_names in os.walk(self.root):
+            if TIME_FILE in file_names:
+                size = sum(os.path.getsize(os.path.join(dir_path, f)) for f in file_names)
+                partitions.append((os.path.getmtime(dir_path), size, dir_path))
+        return partitions
+
+    def evict(self, keep_key=None, keep_days=()):
+        """
+        缓存超出容量时，按最近访问时间由远及近删除分区，直到容量降到上限的90%
+        keep_key、keep_days：不淘汰的分区（当前请求使用的分区）
+        """
+        keep = {os.path.normpath(self._day_dir(keep_key, day)) for day in keep_days} if keep_key else set()
+        with self._lock:
+            if self._size is not None and self._size <= self.max_bytes:
+                return
+            partitions = self._partitions()
+            self._size = sum(p[1] for p in partitions)
+            if self._size <= self.max_bytes:
+                return
+            for _, size, dir_path in sorted(partitions):
+                if os.path.normpath(dir_path) in keep:
+                    continue
+                shutil.rmtree(dir_path, ignore_errors=True)
+                self._size -= size
+                if self._size <= self.max_bytes * 0.9:
+                    break
+
+    def clear(self):
+        """
+        清空缓存
+        """
+        with self._lock:
+            shutil.rmtree(self.root, ignore_errors=True)
+            self._size = 0
+
+
+def cache_days(start_date, end_date, now=None, settle_hours=0):
+    """
+    计算[start_date, end_date)中可以缓存的完整日期：结束时间早于当前时间settle_hours小时以上的日期，
+    刚结束的日期可能还有延迟入库的数据，不缓存
+    return：(完整日期DatetimeIndex, 完整日期起点, 完整日期终点)
+    """
+    start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    first_day = start.normalize()
+    if first_day < start:
+        first_day = first_day + pd.Timedelta(days=1)
+    now = pd.Timestamp.now() if now is None else pd.Timestamp(now)
+    last_day = min(end.normalize(), (now - pd.Timedelta(hours=settle_hours)).normalize())
+    if first_day >= last_day:
+        return pd.DatetimeIndex([]), None, None
+    return pd.date_range(first_day, last_day, freq='D', inclusive='left'), first_day, last_day
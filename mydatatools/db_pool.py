@@ -0,0 +1,91 @@
+import threading
+import time
+
+from mydatatools import read_config as config
+
+
+MYSQL_URL_FORMAT = 'mysql+pymysql://%(user)s:%(password)s@%(host)s:%(port)s/%(database)s?charset=utf8'
+
+# 进程内共享的engine注册表，key为(连接串格式, host, port, user, database)
+_ENGINES = {}
+_ENGINES_LOCK = threading.Lock()
+
+# 表字段缓存，key为(host, port, user, database, table_name)，value为(过期时间, 字段列表)
+_TABLE_COLUMNS = {}
+
+
+def get_engine(db_info, pool_size=None, max_overflow=None, pool_recycle=None, pool_pre_ping=None):
+    """
+    获取（或创建）连接池化的engine，同一数据库在进程内复用同一个engine
+    :param db_info: 数据库连接信息，需包含user, password, host, port, database；
+                    可选url_format指定连接串格式（默认MySQL），例：'sqlite:///./bench/%(database)s.db'
+    :param pool_size: 连接池大小，默认读取配置conn_pool.pool_size
+    :param max_overflow: 连接池允许溢出的连接数
+    :param pool_recycle: 连接回收时间(秒)，避免使用被MySQL断开的连接
+    :param pool_pre_ping: 取连接前是否ping检测
+    :return: sqlalchemy engine
+    """
+    url_format = db_info.get('url_format') or MYSQL_URL_FORMAT
+    key = (url_format, db_info['host'], str(db_info['port']), db_info['user'], db_info['database'])
+    engine = _ENGINES.get(key)
+    if engine is not None:
+        return engine
+
+    with _ENGINES_LOCK:
+        engine = _ENGINES.get(key)
+        if engine is None:
+            from sqlalchemy import create_engine
+            engine = create_engine(
+                url_format % db_info,
+                pool_size=config.POOL_SIZE if pool_size is None else pool_size,
+                max_overflow=config.POOL_MAX_OVERFLOW if max_overflow is None else max_overflow,
+                pool_recycle=config.POOL_RECYCLE if pool_recycle is None else pool_recycle,
+                pool_pre_ping=config.POOL_PRE_PING if pool_pre_ping is None else pool_pre_ping,
+            )
+            _ENGINES[key] = engine
+    return engine
+
+
+def dispose_engines(close=True):
+    """
+    释放所有engine的连接池，任务结束时调用
+    :param close: 是否关闭池中的连接；fork出的子进程中应传False，只丢弃从父进程继承的连接而不关闭
+    """
+    with _ENGINES_LOCK:
+        for engine in _ENGINES.values():
+            engine.dispose(close=close)
+        _ENGINES.clear()
+
+
+def get_table_columns(engine, database, table_name, ttl=None):
+    """
+    获取表的字段名列表，结果按(服务器, 用户, 库, 表)缓存，过期前不再访问数据库
+    通过不返回数据行的查询读取游标描述获得字段名，不会传输任何数据行
+    :param engine: sqlalchemy engine
+    :param database: 库名
+    :param table_name: 表名
+    :param ttl: 缓存有效期(秒)，默认读取配置cache.schema_ttl
+    :return: 字段名列表
+    """
+    # 同一主机上不同端口的服务器分别缓存
+    key = (engine.url.host, engine.url.port, engine.url.username, database, table_name)
+    cached = _TABLE_COLUMNS.get(key)
+    if cached is not None and cached[0] > time.time():
+        return cached[1]
+
+    with engine.connect() as conn:
+        columns = list(conn.exec_driver_sql(f"SELECT * FROM {table_name} WHERE 1 = 0").keys())
+    ttl = config.SCHEMA_CACHE_TTL if ttl is None else ttl
+    _TABLE_COLUMNS[key] = (time.time() + ttl, columns)
+    return columns
+
+
+def invalidate_table_columns(database=None, table_name=None):
+    """
+    清除表字段缓存，不指定参数时全部清除
+    :param database: 只清除该库的缓存
+    :param table_name: 只清除该表的缓存
+    """
+    for key in list(_TABLE_COLUMNS):
+        if (database is None or key[3] == database) and (table_name is None or key[4] == table_name):
+            _TABLE_COLUMNS.pop(key, None)
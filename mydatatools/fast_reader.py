@@ -0,0 +1,171 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+
+_INT, _FLOAT, _DATETIME, _STR, _OBJECT = 'int', 'float', 'datetime', 'str', 'object'
+_DTYPES = {_INT: np.int64, _FLOAT: np.float64, _DATETIME: 'datetime64[us]', _STR: object, _OBJECT: object}
+_NULLS = {_FLOAT: np.nan, _DATETIME: np.datetime64('NaT'), _STR: None, _OBJECT: None}
+
+# MySQL字段类型（pymysql.constants.FIELD_TYPE）对应的列类型，驱动对这些类型总是返回同一种Python类型或None
+_MYSQL_KINDS = {
+    1: _INT, 2: _INT, 3: _INT, 8: _INT, 9: _INT, 13: _INT,
+    4: _FLOAT, 5: _FLOAT,
+    7: _DATETIME, 12: _DATETIME,
+    15: _STR, 245: _STR, 247: _STR, 253: _STR, 254: _STR,
+}
+
+
+class FallbackError(Exception):
+    """
+    列的取值类型与已确定的列类型不一致，无法保证与pd.read_sql_query的结果一致
+    """
+
+
+def _value_kind(value):
+    if type(value) is float:
+        return _FLOAT
+    if type(value) is int:
+        return _INT
+    if type(value) is datetime.datetime and value.tzinfo is None:
+        return _DATETIME
+    if isinstance(value, (str, bytes)):
+        return _STR
+    return _OBJECT
+
+
+class _ColumnBuffer(object):
+    """
+    一列的预分配缓冲，每批取值由object数组直接转换写入；
+    整型列出现空值或浮点数时整体转换为float64，与read_sql_query的类型推断一致
+    """
+    def __init__(self, capacity, kind=None):
+        self.capacity = max(capacity, 1)
+        # 由字段类型确定的列类型，取值不需要逐个检查
+        self.typed = kind is not None
+        self.kind = None
+        self.buf = None
+        self.size = 0
+        # 类型确定前的空值行数
+        self.leading_nulls = 0
+        if kind is not None:
+            self._alloc(kind)
+
+    def _alloc(self, kind):
+        if kind == _INT and self.leading_nulls:
+            kind = _FLOAT
+        self.kind = kind
+        self.buf = np.empty(self.capacity, dtype=_DTYPES[kind])
+        if self.leading_nulls:
+            self.buf[:self.leading_nulls] = _NULLS[kind]
+
+    def _reserve(self, n):
+        if self.size + n <= self.capacity:
+            return
+        while self.capacity < self.size + n:
+            self.capacity *= 2
+        if self.buf is not None:
+            buf = np.empty(self.capacity, dtype=self.buf.dtype)
+            buf[:self.size] = self.buf[:self.size]
+            self.buf = buf
+
+    def _to_float(self):
+        self.kind = _FLOAT
+        self.buf = self.buf.astype(np.float64)
+
+    def append(self, values):
+        """
+        :param values: 一批取值，一维object数组
+        """
+        n = len(values)
+        self._reserve(n)
+        if self.kind is None:
+            first = next((v for v in values if v is not None), None)
+            if first is None:
+                self.leading_nulls += n
+                self.size += n
+                return
+            self._alloc(_value_kind(first))
+
+        target = self.buf[self.size:self.size + n]
+        if self.kind == _INT and not self.typed:
+            # 按取值确定的整型列，避免浮点数被截断
+            types = set(map(type, values))
+            if not types <= {int, float, type(None)}:
+                raise FallbackError(f'int -> {types}')
+            if types != {int}:
+                self._to_float()
+                target = self.buf[self.size:self.size + n]
+        try:
+            target[:] = values
+        except TypeError:
+            # 整型列中的空值
+            if self.kind != _INT:
+                raise FallbackError(self.kind)
+            self._to_float()
+            self.buf[self.size:self.size + n] = values
+        except (ValueError, OverflowError):
+            raise FallbackError(self.kind)
+        self.size += n
+
+    def finish(self):
+        if self.kind is None:
+            return np.full(self.size, None, dtype=object)
+        values = self.buf[:self.size]
+        if self.kind == _FLOAT and self.size and np.isnan(values).all():
+            # 全部为空
+            return np.full(self.size, None, dtype=object)
+        if self.kind == _DATETIME:
+            if self.size and np.isnat(values).all():
+                return np.full(self.size, None, dtype=object)
+            return values.astype('datetime64[ns]')
+        if self.kind == _OBJECT:
+            # Decimal、date、bool等取值由pandas按read_sql_query相同的方式推断类型
+            return pd.DataFrame.from_records(zip(values), columns=[0], coerce_float=True)[0]
+        return values
+
+
+def frame_from_cursor(cursor, batch_size=5000, mysql_types=False):
+    """
+    由已执行查询的DB-API游标逐批fetchmany，按列写入预分配的numpy缓冲，最后一次性生成DataFrame（不再复制）
+    列类型与pd.read_sql_query一致：整型int64、浮点及含空值的整型float64、datetime为datetime64[ns]，
+    字符串等为object，全部为空的列为object
+    :param mysql_types: 是否按cursor.description中的MySQL字段类型确定列类型，否则按第一个非空取值确定
+    """
+    names = [d[0] for d in cursor.description]
+    if len(set(names)) < len(names):
+        raise FallbackError('查询结果中有重复的列名')
+    capacity = cursor.rowcount if cursor.rowcount is not None and cursor.rowcount >= 0 else batch_size
+    buffers = [_ColumnBuffer(capacity, _MYSQL_KINDS.get(d[1]) if mysql_types else None)
+               for d in cursor.description]
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        block = np.empty((len(rows), len(names)), dtype=object)
+        block[:] = rows
+        for j, buffer in enumerate(buffers):
+            buffer.append(block[:, j])
+    return pd.DataFrame({name: buffer.finish() for name, buffer in zip(names, buffers)}, copy=False)
+
+
+def read_sql_fast(sqlstr, engine, batch_size=5000):
+    """
+    pd.read_sql_query(sqlstr, engine)的快速版本：从连接池取出DB-API连接，直接使用驱动（PyMySQL）游标读取，
+    每批取值直接转换写入各列的numpy缓冲，不做逐列的类型推断；取值类型与列类型不一致时改用pd.read_sql_query
+    :param batch_size: 每次fetchmany的行数，批次较小时转换的取值仍在CPU缓存中
+    """
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sqlstr)
+            return frame_from_cursor(cursor, batch_size, mysql_types=engine.dialect.name == 'mysql')
+        finally:
+            cursor.close()
+    except FallbackError:
+        pass
+    finally:
+        conn.close()
+    return pd.read_sql_query(sqlstr, engine)
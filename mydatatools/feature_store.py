@@ -0,0 +1,151 @@
+import json
+import os
+import sqlite3
+import threading
+
+import pandas as pd
+
+
+DAY_FORMAT = '%Y-%m-%d'
+
+
+class FeatureStore(object):
+    """
+    模型日特征持久化存储：本地SQLite文件，按 风场/机组/日期/特征名 保存每天的特征值（JSON），
+    滚动窗口模型只需计算新增日期的特征，其余日期直接读取。
+    特征按模型版本区分，模型版本变化后旧特征不再使用。
+    """
+    def __init__(self, path, version=''):
+        """
+        :param path: 存储文件路径
+        :param version: 模型版本
+        """
+        self.path = path
+        self.version = str(version)
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("PRAGMA journal_mode = WAL")
+                conn.execute("CREATE TABLE IF NOT EXISTS features ("
+                             "farm_code TEXT, turbine TEXT, day TEXT, feature TEXT, version TEXT, value TEXT, "
+                             "PRIMARY KEY (farm_code, turbine, day, feature))")
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=60)
+
+    @staticmethod
+    def _day_strs(days):
+        return [pd.Timestamp(day).strftime(DAY_FORMAT) for day in days]
+
+    def _query(self, sql, params):
+        conn = self._connect()
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def stored_days(self, farm_code, turbine, days, features=None):
+        """
+        返回days中已保存（features全部已保存）的日期
+        """
+        day_strs = self._day_strs(days)
+        if len(day_strs) == 0:
+            return []
+        rows = self._query("SELECT day, feature FROM features WHERE farm_code = ? AND turbine = ? AND version = ? "
+                           "AND day >= ? AND day <= ?",
+                           (farm_code, turbine, self.version, min(day_strs), max(day_strs)))
+        features_by_day = {}
+        for day, feature in rows:
+            features_by_day.setdefault(day, set()).add(feature)
+        stored = []
+        for day, day_str in zip(days, day_strs):
+            day_features = features_by_day.get(day_str)
+            if day_features and (features is None or set(features) <= day_features):
+                stored.append(pd.Timestamp(day))
+        return stored
+
+    def missing_days(self, farm_code, turbine, days, features=None):
+        """
+        返回days中尚未保存的日期
+        """
+        stored = set(self.stored_days(farm_code, turbine, days, features))
+        return [pd.Timestamp(day) for day in days if pd.Timestamp(day) not in stored]
+
+    def read(self, farm_code, turbine, days, features=None):
+        """
+        读取日特征，返回以日期为索引、特征名为列的DataFrame
+        """
+        day_strs = self._day_strs(days)
+        if len(day_strs) == 0:
+            return pd.DataFrame()
+        rows = self._query("SELECT day, feature, value FROM features WHERE farm_code = ? AND turbine = ? "
+                           "AND version = ? AND day >= ? AND day <= ?",
+                           (farm_code, turbine, self.version, min(day_strs), max(day_strs)))
+        wanted_days = set(day_strs)
+        data = {}
+        for day, feature, value in rows:
+            if day in wanted_days and (features is None or feature in features):
+                data.setdefault(feature, {})[pd.Timestamp(day)] = json.loads(value)
+        df = pd.DataFrame(data).sort_index()
+        if features is not None:
+            df = df.reindex(columns=[f for f in features if f in df.columns])
+        return df
+
+    def write(self, farm_code, turbine, features_df):
+        """
+        保存日特征，features_df以日期为索引、特征名为列；已保存的同一天同一特征被覆盖
+        """
+        rows = []
+        for day, values in features_df.iterrows():
+            day_str = pd.Timestamp(day).strftime(DAY_FORMAT)
+            for feature, value in values.items():
+                if hasattr(value, 'item'):
+                    value = value.item()
+                if isinstance(value, float) and value != value:
+                    value = None
+                rows.append((farm_code, turbine, day_str, str(feature), self.version,
+                             json.dumps(value, ensure_ascii=False, default=str)))
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany("INSERT OR REPLACE INTO features VALUES (?, ?, ?, ?, ?, ?)", rows)
+            finally:
+                conn.close()
+        return len(rows)
+
+    def clear(self, farm_code=None, turbine=None):
+        """
+        删除已保存的特征，不指定参数时全部删除
+        """
+        conditions, params = [], []
+        for column, value in (('farm_code', farm_code), ('turbine', turbine)):
+            if value is not None:
+                conditions.append(f'{column} = ?')
+                params.append(value)
+        where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute('DELETE FROM features' + where, params)
+            finally:
+                conn.close()
+
+
+def day_segments(days):
+    """
+    将日期列表合并为连续日期段
+    return：[(段起始日期, 段结束日期（不含）), ...]
+    """
+    segments = []
+    for day in sorted(pd.Timestamp(d) for d in days):
+        if segments and segments[-1][1] == day:
+            segments[-1][1] = day + pd.Timedelta(days=1)
+        else:
+            segments.append([day, day + pd.Timedelta(days=1)])
+    return [tuple(segment) for segment in segments]
@@ -0,0 +1,106 @@
+import threading
+import time
+
+import pandas as pd
+
+from mydatatools import read_config as config
+from mydatatools.db_pool import get_engine
+
+
+# 风场机组目录缓存，key为基础信息库(host, database)，value为(过期时间, FleetCatalog)
+_CATALOGS = {}
+_CATALOGS_LOCK = threading.Lock()
+
+
+class FleetCatalog(object):
+    """
+    风场机组目录：风场 -> 机组 -> 机型
+    """
+    def __init__(self, farms):
+        """
+        :param farms: {风场编号: {机组号: 机型}}，机组号为3位，例：{'30000': {'001': 'SE8715'}}
+        """
+        self.farms = farms
+
+    def get_farm_codes(self):
+        return sorted(self.farms)
+
+    def get_turbines(self, farm_code):
+        """
+        风场下的所有机组号，例：['001', '002']；未知风场返回空列表
+        """
+        return sorted(self.farms.get(farm_code, {}))
+
+    def get_model_type(self, farm_code, turbine):
+        return self.farms.get(farm_code, {}).get(turbine)
+
+    def __len__(self):
+        return sum(len(turbines) for turbines in self.farms.values())
+
+
+def build_catalog(turbine_base_info, all_map_data):
+    """
+    由风机基础信息表（CODE_为风场编号+3位机组号）和点表映射表中单独配置的机组生成风场机组目录
+    """
+    farms = {}
+    for code, model in zip(turbine_base_info['CODE_'].astype(str).tolist(),
+                           turbine_base_info['MODEL_'].tolist()):
+        if len(code) > 3:
+            farms.setdefault(code[:-3], {}).setdefault(code[-3:], model)
+    # 点表映射表中按机组单独配置了点表的机组
+    for farm_code, turbine_code, t_type in zip(all_map_data['FARM_CODE'].tolist(),
+                                               all_map_data['TURBINE_CODE'].tolist(),
+                                               all_map_data['TYPE'].tolist()):
+        if pd.isnull(turbine_code) or turbine_code in ('nan', '') or len(turbine_code) <= 3:
+            continue
+        farm_code = farm_code if farm_code not in ('nan', '') else turbine_code[:-3]
+        farms.setdefault(farm_code, {}).setdefault(turbine_code[-3:], t_type)
+    return FleetCatalog(farms)
+
+
+def get_fleet_catalog(mysqldb_info, all_map_data, ttl=None):
+    """
+    获取风场机组目录，按基础信息库缓存，过期前不再查询数据库
+    :param mysqldb_info: 基础信息库连接信息
+    :param all_map_data: 点表映射表
+    :param ttl: 缓存有效期(秒)，默认读取配置cache.fleet_ttl
+    :return: FleetCatalog
+    """
+    key = (mysqldb_info['host'], mysqldb_info['database'])
+    with _CATALOGS_LOCK:
+        cached = _CATALOGS.get(key)
+        if cached is not None and cached[0] > time.time():
+            return cached[1]
+        engine = get_engine(mysqldb_info)
+        turbine_base_info = pd.read_sql_query("select CODE_, MODEL_ from tb_wind_base_wtgs;", engine)
+        catalog = build_catalog(turbine_base_info, all_map_data)
+        ttl = config.FLEET_CATALOG_TTL if ttl is None else ttl
+        _CATALOGS[key] = (time.time() + ttl, catalog)
+        return catalog
+
+
+def invalidate_fleet_catalog():
+    """
+    清除风场机组目录缓存，下次获取时重新查询
+    """
+    with _CATALOGS_LOCK:
+        _CATALOGS.clear()
+
+
+def shard_farms(farm_codes, turbines_lis, shard_index=0, shard_count=1):
+    """
+    按风场将运行任务分片：风场按机组数由多到少依次分给当前机组数最少的分片，结果与调用顺序无关
+    同一风场的机组总在同一分片，风场级计算不受分片影响
+    :return: 当前分片的(farm_codes, turbines_lis)
+    """
+    if shard_count <= 1:
+        return farm_codes, turbines_lis
+    loads = [0] * shard_count
+    assigned = set()
+    for farm_code, turbines in sorted(zip(farm_codes, turbines_lis), key=lambda x: (-len(x[1]), x[0])):
+        i_shard = loads.index(min(loads))
+        loads[i_shard] += max(len(turbines), 1)
+        if i_shard == shard_index:
+            assigned.add(farm_code)
+    pairs = [(f, t) for f, t in zip(farm_codes, turbines_lis) if f in assigned]
+    return [f for f, _ in pairs], [t for _, t in pairs]
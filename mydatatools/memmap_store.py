@@ -0,0 +1,109 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+
+INDEX_FILE = 'index.json'
+TIME_FILE = 'time.i8'
+
+
+def write_memmap(path, df):
+    """
+    将以时间为索引的DataFrame写为定宽二进制列文件：
+        time.i8       按时间排序的int64纳秒时间戳
+        {i}.bin       每列一个文件，数值列按原类型保存，字符串、category列保存为int32编码
+        index.json    行数、索引名、各列的文件名、类型及编码对应的取值
+    先写入临时目录再替换，读取方不会看到不完整的数据
+    :param path: 输出目录
+    :param df: 以时间为索引的DataFrame
+    :return: path
+    """
+    df = df.sort_index(kind='mergesort')
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    times = pd.DatetimeIndex(df.index).as_unit('ns').asi8
+    times.astype('<i8').tofile(os.path.join(tmp_path, TIME_FILE))
+    columns = []
+    for i, name in enumerate(df.columns):
+        series = df[name]
+        item = {'name': str(name), 'file': f'{i}.bin'}
+        if isinstance(series.dtype, pd.CategoricalDtype) or series.dtype == object:
+            categorical = series.astype('category')
+            item['dtype'] = '<i4'
+            item['categories'] = categorical.cat.categories.tolist()
+            values = categorical.cat.codes.to_numpy().astype('<i4')
+        else:
+            values = series.to_numpy()
+            item['dtype'] = values.dtype.newbyteorder('<').str
+            values = values.astype(item['dtype'])
+        values.tofile(os.path.join(tmp_path, item['file']))
+        columns.append(item)
+    with open(os.path.join(tmp_path, INDEX_FILE), 'w', encoding='utf-8') as f:
+        json.dump({'rows': len(df), 'index_name': df.index.name, 'columns': columns}, f, ensure_ascii=False)
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+    return path
+
+
+class MemmapStore(object):
+    """
+    以numpy.memmap只读打开write_memmap写出的列文件，数据不反序列化，多个进程通过页缓存共享同一份数据；
+    按时间切片为对时间列的二分查找。
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, INDEX_FILE), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.rows = self.meta['rows']
+        self.time = self._open(TIME_FILE, '<i8')
+        self._columns = {item['name']: item for item in self.meta['columns']}
+        self._arrays = {}
+
+    def _open(self, file_name, dtype):
+        if self.rows == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(os.path.join(self.path, file_name), dtype=dtype, mode='r', shape=(self.rows,))
+
+    @property
+    def columns(self):
+        return [item['name'] for item in self.meta['columns']]
+
+    def column(self, name):
+        """
+        列的memmap数组（category列为编码）
+        """
+        if name not in self._arrays:
+            item = self._columns[name]
+            self._arrays[name] = self._open(item['file'], item['dtype'])
+        return self._arrays[name]
+
+    def locate(self, start_date=None, end_date=None):
+        """
+        [start_date, end_date)对应的行号范围(lo, hi)
+        """
+        lo = 0 if start_date is None else int(np.searchsorted(self.time, pd.Timestamp(start_date).value, 'left'))
+        hi = self.rows if end_date is None else int(np.searchsorted(self.time, pd.Timestamp(end_date).value, 'left'))
+        return lo, max(lo, hi)
+
+    def to_frame(self, start_date=None, end_date=None, columns=None):
+        """
+        按时间范围、列读取为以时间为索引的DataFrame（只复制切片内的数据）
+        """
+        lo, hi = self.locate(start_date, end_date)
+        data = {}
+        for name in (columns or self.columns):
+            item = self._columns[name]
+            values = self.column(name)[lo:hi]
+            if 'categories' in item:
+                data[name] = pd.Categorical.from_codes(np.asarray(values), categories=item['categories'])
+            else:
+                data[name] = np.array(values)
+        index = pd.DatetimeIndex(np.asarray(self.time[lo:hi]).view('datetime64[ns]'), name=self.meta['index_name'])
+        return pd.DataFrame(data, index=index)
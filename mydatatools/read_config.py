@@ -4,41 +4,94 @@ from configparser import ConfigParser
 
 configfile_path = os.path.join(".", 'config.ini')
 
-assert os.path.exists(configfile_path), f"{os.getcwd()} 配置文件缺失"
-
-cf = ConfigParser()
-cf.read(configfile_path, encoding='utf-8')
-
-RUN_FARM_CODES = cf.get('run_params', 'farm_codes')
-RUN_TURBINES = cf.get('run_params', 'turbines')
-RUN_START_DATE = cf.get('run_params', 'start_date')
-RUN_END_DATE = cf.get('run_params', 'end_date')
-RUN_ALARM_START_DATE = cf.get('run_params', 'alarm_start_date')
-
-IB_HOST = cf.get('conn_IB', 'host')
-IB_PORT = cf.getint('conn_IB', 'port')
-IB_USER = cf.get('conn_IB', 'user')
-IB_PASSWORD = cf.get('conn_IB', 'password')
-IB_DB = cf.get('conn_IB', 'db')
-IB_TABLE = cf.get('conn_IB', 'table_name')
-IB_TURBINE_TYPE = cf.get('conn_IB', 'turbine_type')
-IB_TABLE_FORMAT = cf.get('conn_IB', 'table_format')
-IB_FIELD_FORMAT = cf.get('conn_IB', 'field_format')
-
-BASE_HOST = cf.get('conn_base', 'host')
-BASE_PORT = cf.getint('conn_base', 'port')
-BASE_USER = cf.get('conn_base', 'user')
-BASE_PASSWORD = cf.get('conn_base', 'password')
-BASE_DB = cf.get('conn_base', 'db')
-
-RESULT_HOST = cf.get('conn_result', 'host')
-RESULT_PORT = cf.getint('conn_result', 'port')
-RESULT_USER = cf.get('conn_result', 'user')
-RESULT_PASSWORD = cf.get('conn_result', 'password')
-RESULT_DB = cf.get('conn_result', 'db')
-RESULT_TABLE = cf.get('conn_result', 'table_name')
-
-SFTP_HOST = cf.get('conn_sftp', 'host')
-SFTP_PORT = cf.getint('conn_sftp', 'port')
-SFTP_USER = cf.get('conn_sftp', 'user')
-SFTP_PASSWORD = cf.get('conn_sftp', 'password')
+_REQUIRED = object()
+
+# 配置项：名称 -> (section, option, 类型, 缺省值)，首次访问时才读取config.ini
+_OPTIONS = {
+    'RUN_FARM_CODES': ('run_params', 'farm_codes', str, _REQUIRED),
+    'RUN_TURBINES': ('run_params', 'turbines', str, _REQUIRED),
+    'RUN_START_DATE': ('run_params', 'start_date', str, _REQUIRED),
+    'RUN_END_DATE': ('run_params', 'end_date', str, _REQUIRED),
+    'RUN_ALARM_START_DATE': ('run_params', 'alarm_start_date', str, _REQUIRED),
+
+    'IB_HOST': ('conn_IB', 'host', str, _REQUIRED),
+    'IB_PORT': ('conn_IB', 'port', int, _REQUIRED),
+    'IB_USER': ('conn_IB', 'user', str, _REQUIRED),
+    'IB_PASSWORD': ('conn_IB', 'password', str, _REQUIRED),
+    'IB_DB': ('conn_IB', 'db', str, _REQUIRED),
+    'IB_TABLE': ('conn_IB', 'table_name', str, _REQUIRED),
+    'IB_TURBINE_TYPE': ('conn_IB', 'turbine_type', str, _REQUIRED),
+    'IB_TABLE_FORMAT': ('conn_IB', 'table_format', str, _REQUIRED),
+    'IB_FIELD_FORMAT': ('conn_IB', 'field_format', str, _REQUIRED),
+    'IB_FAST_READER': ('conn_IB', 'fast_reader', bool, False),
+
+    'BASE_HOST': ('conn_base', 'host', str, _REQUIRED),
+    'BASE_PORT': ('conn_base', 'port', int, _REQUIRED),
+    'BASE_USER': ('conn_base', 'user', str, _REQUIRED),
+    'BASE_PASSWORD': ('conn_base', 'password', str, _REQUIRED),
+    'BASE_DB': ('conn_base', 'db', str, _REQUIRED),
+
+    'RESULT_HOST': ('conn_result', 'host', str, _REQUIRED),
+    'RESULT_PORT': ('conn_result', 'port', int, _REQUIRED),
+    'RESULT_USER': ('conn_result', 'user', str, _REQUIRED),
+    'RESULT_PASSWORD': ('conn_result', 'password', str, _REQUIRED),
+    'RESULT_DB': ('conn_result', 'db', str, _REQUIRED),
+    'RESULT_TABLE': ('conn_result', 'table_name', str, _REQUIRED),
+
+    'SFTP_HOST': ('conn_sftp', 'host', str, _REQUIRED),
+    'SFTP_PORT': ('conn_sftp', 'port', int, _REQUIRED),
+    'SFTP_USER': ('conn_sftp', 'user', str, _REQUIRED),
+    'SFTP_PASSWORD': ('conn_sftp', 'password', str, _REQUIRED),
+
+    # 连接池参数（可选配置，缺省时使用默认值）
+    'POOL_SIZE': ('conn_pool', 'pool_size', int, 5),
+    'POOL_MAX_OVERFLOW': ('conn_pool', 'max_overflow', int, 10),
+    'POOL_RECYCLE': ('conn_pool', 'pool_recycle', int, 3600),
+    'POOL_PRE_PING': ('conn_pool', 'pool_pre_ping', bool, True),
+
+    # get_data本地缓存参数（可选配置）
+    'CACHE_ENABLE': ('cache', 'enable', bool, True),
+    'CACHE_DIR': ('cache', 'dir', str, os.path.join('.', 'data_cache')),
+    'CACHE_MAX_SIZE_MB': ('cache', 'max_size_mb', int, 10240),
+    'CACHE_SETTLE_HOURS': ('cache', 'settle_hours', int, 6),
+    'SCHEMA_CACHE_TTL': ('cache', 'schema_ttl', int, 3600),
+    'FLEET_CATALOG_TTL': ('cache', 'fleet_ttl', int, 86400),
+
+    # 进程内相同get_data请求合并（可选配置）
+    'SINGLE_FLIGHT_ENABLE': ('single_flight', 'enable', bool, True),
+    'SINGLE_FLIGHT_COALESCE_MS': ('single_flight', 'coalesce_ms', int, 0),
+}
+
+_cf = None
+
+# from mydatatools.read_config import * 时会读取全部配置项
+__all__ = ['os', 'ConfigParser', 'configfile_path', 'cf'] + list(_OPTIONS)
+
+
+def get_config():
+    """
+    读取config.ini，只在首次调用时解析
+    """
+    global _cf
+    if _cf is None:
+        assert os.path.exists(configfile_path), f"{os.getcwd()} 配置文件缺失"
+        cf_ = ConfigParser()
+        cf_.read(configfile_path, encoding='utf-8')
+        _cf = cf_
+    return _cf
+
+
+def __getattr__(name):
+    """
+    按需读取配置项，读取后缓存为模块属性
+    """
+    if name == 'cf':
+        return get_config()
+    if name not in _OPTIONS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    section, option, value_type, fallback = _OPTIONS[name]
+    getter = {str: 'get', int: 'getint', bool: 'getboolean'}[value_type]
+    kwargs = {} if fallback is _REQUIRED else {'fallback': fallback}
+    value = getattr(get_config(), getter)(section, option, **kwargs)
+    globals()[name] = value
+    return value
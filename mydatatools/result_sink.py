@@ -0,0 +1,129 @@
+import datetime
+import threading
+
+import pandas as pd
+from loguru import logger
+
+from mydatatools.db_pool import get_engine
+
+
+# 已知模型的model_id，其他模型从cms_model_info表查询
+MODEL_ID_DICT = {'mainbearing_fd': 2, 'gearing_low_state_fd': 3, 'generator_electric_fd': 4,
+                 'cms_mainbearing_worsen_factor': 7, 'cms_gearingbox_worsen_factor': 9,
+                 'cms_generator_worsen_factor': 10, 'GearingBoxTempModel': 18, 'GeneratorWindingTempModel': 20,
+                 'GearingBoxOilFilterFDModel': 21}
+
+# 查询到的model_id缓存，key为(host, database, model_name)
+_MODEL_IDS = {}
+_MODEL_IDS_LOCK = threading.Lock()
+
+
+def get_model_id(engine, database, model_name):
+    """
+    获取模型的model_id，查询结果在进程内缓存
+    """
+    if model_name in MODEL_ID_DICT:
+        return MODEL_ID_DICT[model_name]
+    key = (engine.url.host, database, model_name)
+    with _MODEL_IDS_LOCK:
+        if key not in _MODEL_IDS:
+            ret_db_df = pd.read_sql(f"select id from cms_model_info where model_name_en='{model_name}' limit 1",
+                                    con=engine)
+            _MODEL_IDS[key] = ret_db_df["id"][0]
+        return _MODEL_IDS[key]
+
+
+class ResultSink(object):
+    """
+    模型结果增量入库：结果先缓存在内存中，每满batch_size条或调用flush时用多行INSERT批量写入，
+    任务中途失败时已写入的结果不会丢失。
+    upsert=True时，写入前先删除同一模型、风场、机组在同一运行日期的旧结果，重复运行不产生重复数据。
+    """
+    def __init__(self, db_info, model_name, model_from, batch_size=200, upsert=False, run_time=None,
+                 project_id='scada'):
+        """
+        :param db_info: 结果数据库连接信息，需包含table_name
+        :param model_name: 模型名称
+        :param model_from: 模型来源
+        :param batch_size: 每批写入的结果条数
+        :param upsert: 是否按(model_name, farm_code, turbine_num, 运行日期)覆盖旧结果
+        :param run_time: 结果的model_run_time，默认为创建时间，同一次运行的结果使用同一时间
+        :param project_id: 结果的project_id
+        """
+        self.db_info = db_info
+        self.model_name = model_name
+        self.model_from = model_from
+        self.batch_size = batch_size
+        self.upsert = upsert
+        self.run_time = run_time or datetime.datetime.now()
+        self.project_id = project_id
+        self.written = 0
+        self._buffer = []
+        self._has_table = False
+        self._lock = threading.Lock()
+
+    def add(self, result_dict):
+        """
+        添加一条结果，缓存满batch_size条时写入数据库
+        """
+        with self._lock:
+            self._buffer.append(result_dict)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self.flush()
+
+    def extend(self, result_dicts):
+        for result_dict in result_dicts:
+            self.add(result_dict)
+
+    def flush(self):
+        """
+        将缓存的结果写入数据库，返回写入条数
+        """
+        with self._lock:
+            data, self._buffer = self._buffer, []
+            if len(data) == 0:
+                return 0
+            self._write(data)
+            self.written += len(data)
+        return len(data)
+
+    def _table_exists(self, conn, table_name):
+        # 结果表首次写入前不存在时无需删除旧结果
+        if not self._has_table:
+            from sqlalchemy import inspect
+            self._has_table = inspect(conn).has_table(table_name)
+        return self._has_table
+
+    def _write(self, data):
+        from sqlalchemy import bindparam, text
+        from sqlalchemy.types import JSON
+
+        engine = get_engine(self.db_info)
+        table_name = self.db_info['table_name']
+        ret_df = pd.DataFrame(data)
+        ret_df["model_from"] = self.model_from
+        ret_df["model_id"] = get_model_id(engine, self.db_info['database'], self.model_name)
+        ret_df["model_name"] = self.model_name
+        ret_df["model_run_time"] = self.run_time
+        ret_df["img_sync_status"] = 0
+        ret_df["project_id"] = self.project_id
+
+        logger.debug(f'[{self.model_name}] 结果数据长度：{len(ret_df)}')
+        logger.opt(lazy=True).debug('[{}] 结果数据：{}', lambda: self.model_name, lambda: ret_df.head(3))
+        # 删除旧结果与写入在同一事务中完成
+        with engine.begin() as conn:
+            if self.upsert and self._table_exists(conn, table_name):
+                day = pd.Timestamp(self.run_time).normalize()
+                for farm_code, turbine_nums in ret_df.groupby('farm_code')['turbine_num']:
+                    sql = text(f"DELETE FROM {table_name} WHERE model_name = :model_name AND farm_code = :farm_code "
+                               f"AND turbine_num IN :turbine_nums "
+                               f"AND model_run_time >= :day_start AND model_run_time < :day_end"
+                               ).bindparams(bindparam('turbine_nums', expanding=True))
+                    conn.execute(sql, {'model_name': self.model_name, 'farm_code': farm_code,
+                                       'turbine_nums': list(turbine_nums.unique()),
+                                       'day_start': day.to_pydatetime(),
+                                       'day_end': (day + pd.Timedelta(days=1)).to_pydatetime()})
+            # executemany写入，pymysql会将INSERT ... VALUES合并为多行INSERT，比method='multi'编译大语句更快
+            ret_df.to_sql(name=table_name, con=conn, if_exists='append', index=False,
+                          chunksize=self.batch_size, dtype={"sub_image_json": JSON})
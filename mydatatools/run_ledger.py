@@ -0,0 +1,139 @@
+import datetime
+import json
+import os
+import pickle
+import sqlite3
+import threading
+
+from loguru import logger
+
+
+# 机组的完成阶段，按顺序推进
+STAGE_COMPUTED = 'computed'
+STAGE_UPLOADED = 'uploaded'
+STAGE_WRITTEN = 'written'
+
+
+def _json_default(obj):
+    # numpy数值等转为python原生类型
+    if hasattr(obj, 'item'):
+        return obj.item()
+    return str(obj)
+
+
+class RunLedger(object):
+    """
+    模型运行记录：本地SQLite文件，按 模型/运行日期/数据起止时间/风场/机组 记录计算、图片上传、结果入库三个阶段的完成情况，
+    任务中途失败后重新运行时跳过已完成的阶段。
+    机组计算期间写入feature_result的条目随计算结果一起记录，跳过的机组由此恢复风场级计算所需的数据。
+    """
+    def __init__(self, path, model_name, run_date, start_date, end_date):
+        """
+        :param path: 记录文件路径
+        :param model_name: 模型名称
+        :param run_date: 运行日期，例：'20240320'
+        :param start_date: 本次运行数据的开始时间
+        :param end_date: 本次运行数据的结束时间，数据时间范围不同的运行不复用记录
+        """
+        self.path = path
+        self.model_name = model_name
+        self.run_date = run_date
+        self.start_date = str(start_date)
+        self.end_date = str(end_date)
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connect()
+        try:
+            with conn:
+                columns = [row[1] for row in conn.execute("PRAGMA table_info(run_ledger)")]
+                if columns and 'start_date' not in columns:
+                    # 旧版本的记录不含数据时间范围，无法判断能否复用
+                    conn.execute("DROP TABLE run_ledger")
+                conn.execute("CREATE TABLE IF NOT EXISTS run_ledger ("
+                             "model_name TEXT, run_date TEXT, start_date TEXT, end_date TEXT, "
+                             "farm_code TEXT, turbine TEXT, stage TEXT, "
+                             "ret TEXT, remote_files TEXT, state BLOB, update_time TEXT, "
+                             "PRIMARY KEY (model_name, run_date, start_date, end_date, farm_code, turbine))")
+        finally:
+            conn.close()
+
+    @property
+    def _key(self):
+        return self.model_name, self.run_date, self.start_date, self.end_date
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _execute(self, sql, rows):
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany(sql, rows)
+            finally:
+                conn.close()
+
+    def load(self):
+        """
+        读取本次运行已完成的记录
+        return：{(风场, 机组): (阶段, 计算结果, 远程图片路径列表, feature_result条目)}
+        """
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT farm_code, turbine, stage, ret, remote_files, state FROM run_ledger "
+                                "WHERE model_name = ? AND run_date = ? AND start_date = ? AND end_date = ?",
+                                self._key).fetchall()
+        finally:
+            conn.close()
+        return {(farm_code, turbine): (stage, json.loads(ret), json.loads(remote_files) if remote_files else None,
+                                       pickle.loads(state) if state is not None else {})
+                for farm_code, turbine, stage, ret, remote_files, state in rows}
+
+    def mark_computed(self, farm_code, turbine, ret, state=None):
+        """
+        记录机组计算完成及其计算结果
+        :param state: 机组计算期间写入feature_result的条目
+        return：是否已记录，state无法序列化时不记录，重新运行时该机组重新计算
+        """
+        try:
+            state = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL) if state else None
+        except Exception as e:
+            logger.warning(f'[{self.model_name}] {farm_code}_{turbine}的feature_result无法序列化，不记入运行记录：{e!r}')
+            return False
+        now = datetime.datetime.now().isoformat()
+        self._execute("INSERT OR REPLACE INTO run_ledger VALUES (?, ?, ?, ?, ?, ?, ?, ?, NULL, ?, ?)",
+                      [(*self._key, farm_code, turbine, STAGE_COMPUTED,
+                        json.dumps(None if ret is None else list(ret), default=_json_default, ensure_ascii=False),
+                        state, now)])
+        return True
+
+    def mark_uploaded(self, result_dicts):
+        """
+        记录结果图片上传完成及远程图片路径
+        """
+        now = datetime.datetime.now().isoformat()
+        self._execute("UPDATE run_ledger SET stage = ?, remote_files = ?, update_time = ? "
+                      "WHERE model_name = ? AND run_date = ? AND start_date = ? AND end_date = ? "
+                      "AND farm_code = ? AND turbine = ?",
+                      [(STAGE_UPLOADED,
+                        json.dumps([d['main_image']] + list(d['sub_image_json'].values()), ensure_ascii=False),
+                        now, *self._key, d['farm_code'], d['turbine_num'])
+                       for d in result_dicts])
+
+    def mark_written(self, result_dicts):
+        """
+        记录结果入库完成
+        """
+        now = datetime.datetime.now().isoformat()
+        self._execute("UPDATE run_ledger SET stage = ?, update_time = ? "
+                      "WHERE model_name = ? AND run_date = ? AND start_date = ? AND end_date = ? "
+                      "AND farm_code = ? AND turbine = ?",
+                      [(STAGE_WRITTEN, now, *self._key, d['farm_code'], d['turbine_num'])
+                       for d in result_dicts])
+
+    def clear(self):
+        """
+        清除本次运行的记录
+        """
+        self._execute("DELETE FROM run_ledger WHERE model_name = ? AND run_date = ? AND start_date = ? AND end_date = ?",
+                      [self._key])
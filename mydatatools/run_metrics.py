@@ -0,0 +1,130 @@
+import csv
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+from loguru import logger
+
+
+# 各阶段记录中累加的数量字段
+COUNT_FIELDS = ('rows', 'bytes', 'files')
+
+
+class RunMetrics(object):
+    """
+    模型运行分阶段计时：记录每个阶段、每台机组的耗时及读取行数、上传字节数、入库行数，
+    每条记录通过loguru输出（记录字段绑定在extra中），运行结束时输出含p50/p95统计的运行报告。
+    """
+    def __init__(self, name=''):
+        self.name = name
+        self.records = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, stage, **fields):
+        """
+        对一个阶段计时，with块内可在返回的记录中填写rows、bytes等数量
+        with metrics.stage('fetch', farm_code=farm_code, turbine=turbine) as rec:
+            df = ...
+            rec['rows'] = len(df)
+        """
+        record = dict(stage=stage, **fields)
+        start = time.perf_counter()
+        try:
+            yield record
+        except Exception:
+            record['error'] = True
+            raise
+        finally:
+            record['seconds'] = round(time.perf_counter() - start, 6)
+            self.add(record)
+
+    def add(self, record, log=True):
+        """
+        添加一条阶段记录
+        :param log: 是否通过loguru输出该记录
+        """
+        with self._lock:
+            self.records.append(record)
+        if log:
+            logger.bind(metrics=self.name, **record).debug(
+                f'[{self.name}] ' + ' '.join(f'{k}={v}' for k, v in record.items()))
+
+    def extend(self, records, log=True):
+        """
+        添加多条阶段记录
+        :param log: 是否通过loguru输出；合并子进程中产生、已在子进程输出过的记录时传False
+        """
+        for record in records:
+            self.add(record, log=log)
+
+    def summary(self):
+        """
+        按阶段汇总：次数、总耗时、p50/p95/最大耗时及各数量之和
+        """
+        with self._lock:
+            records = list(self.records)
+        stages = {}
+        for record in records:
+            stages.setdefault(record['stage'], []).append(record)
+        summary = {}
+        for stage, stage_records in stages.items():
+            seconds = np.array([r['seconds'] for r in stage_records])
+            item = {'count': len(stage_records),
+                    'errors': sum(1 for r in stage_records if r.get('error')),
+                    'seconds_total': round(float(seconds.sum()), 3),
+                    'seconds_p50': round(float(np.percentile(seconds, 50)), 3),
+                    'seconds_p95': round(float(np.percentile(seconds, 95)), 3),
+                    'seconds_max': round(float(seconds.max()), 3)}
+            for field in COUNT_FIELDS:
+                if any(field in r for r in stage_records):
+                    item[field] = int(sum(r.get(field, 0) for r in stage_records))
+            if 'rows' in item and item['seconds_total'] > 0:
+                item['rows_per_second'] = round(item['rows'] / item['seconds_total'], 1)
+            summary[stage] = item
+        return summary
+
+    def log_summary(self):
+        for stage, item in self.summary().items():
+            logger.bind(metrics=self.name, stage=stage, **item).info(
+                f'[{self.name}] 阶段{stage}：' + ' '.join(f'{k}={v}' for k, v in item.items()))
+
+    def to_json(self, path, **info):
+        """
+        写入JSON运行报告：info中的运行信息、各阶段汇总及全部明细记录
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._lock:
+            records = list(self.records)
+        report = dict(info, summary=self.summary(), records=records)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+        return path
+
+    def to_csv(self, path):
+        """
+        写入CSV明细记录，每行一条阶段记录
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._lock:
+            records = list(self.records)
+        fields = []
+        for record in records:
+            fields += [k for k in record if k not in fields]
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(records)
+        return path
+
+
+def metrics_stage(metrics, stage, **fields):
+    """
+    metrics为None时不计时，返回的记录可照常填写
+    """
+    if metrics is None:
+        return nullcontext({})
+    return metrics.stage(stage, **fields)
@@ -0,0 +1,249 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from loguru import logger
+
+from mydatatools.run_metrics import metrics_stage
+
+
+def ftp_connect(host, port, username, password):
+    """
+    ftp连接
+    :param host:
+    :param port:
+    :param username:
+    :param password:
+    :return:
+    """
+    import paramiko
+
+    ssh_t = paramiko.Transport((host, port))
+    ssh_t.connect(username=username, password=password)
+    sftp = paramiko.SFTPClient.from_transport(ssh_t)
+    return sftp, ssh_t
+
+
+def _add_known_dir(known_dirs, dir_path):
+    """
+    记录已存在的远程目录，目录存在则其所有上级目录也存在
+    """
+    while dir_path and dir_path not in known_dirs:
+        known_dirs.add(dir_path)
+        dir_path = dir_path.rsplit('/', 1)[0]
+
+
+def _ftp_mkdir_once(ftp, dir_path):
+    """
+    创建单级目录，目录已被其他通道或进程创建时忽略
+    """
+    try:
+        ftp.mkdir(dir_path)
+    except IOError:
+        try:
+            ftp.stat(dir_path)
+        except FileNotFoundError:
+            raise
+
+
+def ftp_mkdir_new(ftp, dir_path, known_dirs=None):
+    """
+    sftp 文件传输在remote上递归创建多级目录
+    :param ftp: sftp客户端
+    :param dir_path: 需创建的目录，绝对路径
+    :param known_dirs: 已知存在的远程目录集合，命中时不再stat
+    :return:
+    """
+    up_dir = '/'.join(dir_path.split('/')[:-1])
+    dir_name = dir_path.split('/')[-1]
+    if known_dirs is not None and up_dir in known_dirs:
+        up_dir_exist = True
+    else:
+        try:
+            ftp.stat(up_dir)
+            up_dir_exist = True
+        except FileNotFoundError:
+            up_dir_exist = False
+    if up_dir_exist is True:
+        ret = up_dir + '/' + dir_name
+    else:
+        ret = ftp_mkdir_new(ftp, up_dir, known_dirs) + '/' + dir_name
+    _ftp_mkdir_once(ftp, ret)
+    if known_dirs is not None:
+        _add_known_dir(known_dirs, ret)
+    return ret
+
+
+def ftp_mkdir(ftp, dir_path, known_dirs=None):
+    """
+    sftp 创建remote目录，目录存在则直接返回，不存在则新建目录
+    :param ftp:
+    :param dir_path:
+    :param known_dirs: 已知存在的远程目录集合，命中时没有任何远程调用
+    :return:
+    """
+    if known_dirs is not None and dir_path in known_dirs:
+        return dir_path
+    try:
+        ftp.stat(dir_path)
+        if known_dirs is not None:
+            _add_known_dir(known_dirs, dir_path)
+        return dir_path
+    except FileNotFoundError:
+        return ftp_mkdir_new(ftp, dir_path, known_dirs)
+
+
+def ftp_makedirs(ftp, dir_paths, known_dirs=None):
+    """
+    一次性创建一批远程目录（如一次运行所有风场、机组的上传目录）
+    按层级由浅到深处理，公共上级目录只检查一次，新建目录的子目录直接创建不再stat
+    :param ftp: sftp客户端
+    :param dir_paths: 需创建的目录列表，绝对路径
+    :param known_dirs: 已知存在的远程目录集合，创建结果同时记录在其中
+    :return: known_dirs
+    """
+    if known_dirs is None:
+        known_dirs = set()
+    todo = set()
+    for dir_path in dir_paths:
+        while dir_path and dir_path not in todo:
+            todo.add(dir_path)
+            dir_path = dir_path.rsplit('/', 1)[0]
+
+    created = set()
+    for dir_path in sorted(todo, key=lambda p: (p.count('/'), p)):
+        if dir_path in known_dirs:
+            continue
+        if dir_path.rsplit('/', 1)[0] not in created:
+            try:
+                ftp.stat(dir_path)
+                _add_known_dir(known_dirs, dir_path)
+                continue
+            except FileNotFoundError:
+                pass
+        _ftp_mkdir_once(ftp, dir_path)
+        created.add(dir_path)
+        _add_known_dir(known_dirs, dir_path)
+    return known_dirs
+
+
+class SftpUploader(object):
+    """
+    SFTP后台上传：在同一个SSH连接上打开多个SFTP通道，由线程池并发上传，
+    上传与模型计算重叠进行，失败时重建通道重试。
+    """
+    def __init__(self, transport=None, ftp_info=None, channels=4, retries=3, retry_interval=1.0, sftp_factory=None,
+                 metrics=None):
+        """
+        :param transport: 已连接的paramiko Transport，为None时按ftp_info建立连接
+        :param ftp_info: sftp连接信息，host, port, username, password
+        :param channels: SFTP通道数（上传线程数）
+        :param retries: 单次上传失败后的重试次数
+        :param retry_interval: 重试间隔(秒)，按重试次数递增
+        :param sftp_factory: 创建SFTP客户端的函数，默认在transport上打开新通道；可替换为本地SFTP替身用于测试
+        :param metrics: RunMetrics实例，给定时记录每次上传的耗时和字节数
+        """
+        self.transport = transport
+        self.ftp_info = ftp_info
+        self.retries = retries
+        self.retry_interval = retry_interval
+        self.sftp_factory = sftp_factory or self._open_channel
+        self.metrics = metrics
+        self._own_transport = False
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._clients = []
+        # 该连接上已知存在的远程目录，各通道共享
+        self.known_dirs = set()
+        self._executor = ThreadPoolExecutor(max_workers=channels, thread_name_prefix='sftp_upload')
+
+    def _open_channel(self):
+        """
+        在SSH连接上打开一个新的SFTP通道，连接断开时重新连接
+        """
+        import paramiko
+
+        with self._lock:
+            if self.transport is None or not self.transport.is_active():
+                sftp, self.transport = ftp_connect(**self.ftp_info)
+                sftp.close()
+                self._own_transport = True
+            return paramiko.SFTPClient.from_transport(self.transport)
+
+    def _client(self):
+        """
+        当前线程使用的SFTP客户端，每个上传线程独占一个通道
+        """
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self.sftp_factory()
+            self._local.client = client
+            with self._lock:
+                self._clients.append(client)
+        return client
+
+    def _reset_client(self):
+        client = getattr(self._local, 'client', None)
+        self._local.client = None
+        if client is not None:
+            try:
+                client.close()
+            except Exception:
+                pass
+
+    def upload(self, files, remote_dir):
+        """
+        同步上传一组文件到remote_dir，返回远程文件路径列表
+        """
+        for file in files:
+            if not os.path.exists(file):
+                raise FileNotFoundError(f'待上传文件不存在：{file}')
+        with metrics_stage(self.metrics, 'upload', remote_dir=remote_dir) as rec:
+            rec['files'] = len(files)
+            rec['bytes'] = sum(os.path.getsize(file) for file in files)
+            return self._upload(files, remote_dir)
+
+    def _upload(self, files, remote_dir):
+        for attempt in range(self.retries + 1):
+            try:
+                sftp = self._client()
+                remote_dir_ = ftp_mkdir(sftp, remote_dir, self.known_dirs)
+                remote_files = [remote_dir_ + '/' + f.split(os.path.sep)[-1] for f in files]
+                for file, r_file in zip(files, remote_files):
+                    sftp.put(file, r_file)
+                    logger.info(f'{file}文件上传{r_file}成功！')
+                return remote_files
+            except Exception as e:
+                if attempt >= self.retries:
+                    raise
+                logger.warning(f'上传{remote_dir}失败，第{attempt + 1}次重试：{e!r}')
+                self._reset_client()
+                time.sleep(self.retry_interval * (attempt + 1))
+
+    def makedirs(self, dir_paths):
+        """
+        预先一次性创建一批远程目录，之后上传到这些目录不再有目录相关的远程调用
+        """
+        ftp_makedirs(self._client(), dir_paths, self.known_dirs)
+
+    def submit(self, files, remote_dir):
+        """
+        提交后台上传任务，返回Future，结果为远程文件路径列表
+        """
+        return self._executor.submit(self.upload, files, remote_dir)
+
+    def close(self):
+        """
+        等待所有上传完成并关闭通道
+        """
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            for client in self._clients:
+                try:
+                    client.close()
+                except Exception:
+                    pass
+            self._clients = []
+            if self._own_transport and self.transport is not None:
+                self.transport.close()
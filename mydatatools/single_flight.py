@@ -0,0 +1,97 @@
+import threading
+import time
+
+from mydatatools import read_config as config
+
+
+class _Flight(object):
+    """
+    一次进行中的查询
+    """
+    def __init__(self, tags):
+        self.tags = list(tags)
+        self.started = False
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        # 共享结果的其他调用方数量
+        self.waiters = 0
+
+
+class SingleFlight(object):
+    """
+    进程内相同请求合并：同一key（库/表/机组/时间范围/查询选项）同时只执行一次查询，
+    并发的调用方所需字段是进行中查询字段的子集时，等待并共享该查询的结果；
+    coalesce大于0时，查询在发起前等待coalesce秒，期间到达的调用方的字段合并到同一次查询中。
+    """
+    def __init__(self, coalesce=0.0):
+        """
+        :param coalesce: 合并窗口(秒)，0表示不等待，只共享字段为子集的进行中查询
+        """
+        self.coalesce = coalesce
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def do(self, key, tags, fetch_func):
+        """
+        执行或加入一次查询
+        :param key: 请求的标准化key（不含字段）
+        :param tags: 本次调用需要的字段
+        :param fetch_func: 查询函数fetch_func(tags)，tags为合并后的字段
+        :return: (查询结果, 结果是否与其他调用方共享)，共享的结果不应原地修改
+        """
+        leader = False
+        with self._lock:
+            flights = self._flights.setdefault(key, [])
+            for flight in flights:
+                if set(tags) <= set(flight.tags):
+                    flight.waiters += 1
+                    break
+                # 尚未发起的查询合并字段
+                if not flight.started and self.coalesce > 0:
+                    flight.tags.extend(t for t in tags if t not in flight.tags)
+                    flight.waiters += 1
+                    break
+            else:
+                flight = _Flight(tags)
+                flights.append(flight)
+                leader = True
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            if self.coalesce > 0:
+                time.sleep(self.coalesce)
+            with self._lock:
+                flight.started = True
+                tags = list(flight.tags)
+            flight.result = fetch_func(tags)
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                flights.remove(flight)
+                if not flights and self._flights.get(key) is flights:
+                    del self._flights[key]
+            flight.done.set()
+        return flight.result, flight.waiters > 0
+
+
+_SINGLE_FLIGHT = None
+_SINGLE_FLIGHT_LOCK = threading.Lock()
+
+
+def get_single_flight():
+    """
+    进程内共享的SingleFlight，合并窗口读取配置single_flight.coalesce_ms
+    """
+    global _SINGLE_FLIGHT
+    with _SINGLE_FLIGHT_LOCK:
+        if _SINGLE_FLIGHT is None:
+            _SINGLE_FLIGHT = SingleFlight(config.SINGLE_FLIGHT_COALESCE_MS / 1000)
+        return _SINGLE_FLIGHT
@@ -0,0 +1,71 @@
+import os
+import pickle
+import threading
+
+import pandas as pd
+
+
+class RollingWindowBuffer(object):
+    """
+    滚动窗口数据缓冲：本地pkl文件保存最近一个窗口的数据及其时间范围，
+    窗口向后滚动时只查询新增的时间段并追加，同时丢弃早于窗口起点的数据。
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        """
+        读取缓冲，return：{'start': 起始时间, 'end': 结束时间（不含）, 'data': 以时间为索引的DataFrame}，不存在时返回None
+        """
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def save(self, start, end, data):
+        # 先写临时文件再替换，避免中断时留下不完整的文件
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f'{self.path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'start': start, 'end': end, 'data': data}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _slice(data, start, end):
+        if len(data) == 0:
+            return data
+        return data[(data.index >= start) & (data.index < end)]
+
+    def get(self, fetch_func, start_date, end_date, refetch=None):
+        """
+        获取[start_date, end_date)的数据
+        :param fetch_func: 查询函数fetch_func(start, end)，返回[start, end)内以时间为索引的DataFrame
+        :param start_date: 窗口起始时间
+        :param end_date: 窗口结束时间（不含）
+        :param refetch: 重新查询缓冲末尾的时长，例：'1h'，用于补齐入库延迟的数据
+        :return: 以时间为索引的DataFrame
+        """
+        start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        state = self.load()
+        if state is None or state['start'] > start or state['end'] < start:
+            # 没有可用的缓冲，或缓冲与窗口不连续，查询整个窗口
+            data = fetch_func(start, end)
+            self.save(start, end, data)
+            return data
+
+        data = state['data']
+        buffer_end = state['end']
+        if buffer_end < end:
+            delta_start = buffer_end - pd.Timedelta(refetch) if refetch else buffer_end
+            delta_start = max(delta_start, start)
+            delta = fetch_func(delta_start, end)
+            kept = data[data.index < delta_start] if len(data) > 0 else data
+            data = pd.concat([kept, delta]) if len(kept) > 0 else delta
+            buffer_end = end
+        data = self._slice(data, start, buffer_end)
+        if state['end'] < end or state['start'] < start:
+            self.save(start, buffer_end, data)
+        return self._slice(data, start, end)